@@ -0,0 +1,112 @@
+# Imports
+from qgis.PyQt.QtCore import Qt, pyqtSignal
+from qgis.PyQt.QtGui import QColor
+from qgis.core import QgsGeometry, QgsPointXY, QgsRectangle, QgsWkbTypes
+from qgis.gui import QgsMapTool, QgsRubberBand
+
+
+class AreaSelectTool(QgsMapTool):
+    """Map tool which lets the user draw an area on the canvas and emits it as a polygon in map coordinates.
+
+    Modes:
+        RECTANGLE: press, drag and release.
+        LASSO: press and drag a freehand outline, release to close it.
+        POLYGON: left click to add vertices, right click (or double click) to close the polygon.
+    """
+
+    RECTANGLE = "rectangle"
+    LASSO = "lasso"
+    POLYGON = "polygon"
+
+    areaSelected = pyqtSignal(QgsGeometry)
+
+    def __init__(self, canvas, mode=RECTANGLE):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.mode = mode
+        self.points = []
+        self.start_point = None
+
+        self.rubber_band = QgsRubberBand(canvas, QgsWkbTypes.PolygonGeometry)
+        self.rubber_band.setColor(QColor(255, 140, 0, 200))
+        self.rubber_band.setFillColor(QColor(255, 140, 0, 40))
+        self.rubber_band.setWidth(2)
+
+        self.setCursor(Qt.CrossCursor)
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.reset()
+
+    def reset(self):
+        self.points = []
+        self.start_point = None
+        self.rubber_band.reset(QgsWkbTypes.PolygonGeometry)
+
+    def _show_points(self, points):
+        self.rubber_band.reset(QgsWkbTypes.PolygonGeometry)
+        for i, point in enumerate(points):
+            self.rubber_band.addPoint(point, i == len(points) - 1)
+
+    def _finish(self, geometry):
+        self.reset()
+        if geometry is not None and not geometry.isEmpty() and geometry.area() > 0:
+            self.areaSelected.emit(geometry)
+
+    def canvasPressEvent(self, event):
+        point = self.toMapCoordinates(event.pos())
+
+        if self.mode == self.POLYGON:
+            if event.button() == Qt.RightButton:
+                self._finish_polygon()
+            elif event.button() == Qt.LeftButton:
+                self.points.append(QgsPointXY(point))
+                self._show_points(self.points)
+            return
+
+        if event.button() == Qt.LeftButton:
+            self.start_point = QgsPointXY(point)
+            self.points = [self.start_point]
+
+    def canvasMoveEvent(self, event):
+        point = QgsPointXY(self.toMapCoordinates(event.pos()))
+
+        if self.mode == self.POLYGON:
+            if self.points:
+                self._show_points(self.points + [point])
+        elif self.start_point is not None:
+            if self.mode == self.RECTANGLE:
+                self.rubber_band.setToGeometry(QgsGeometry.fromRect(QgsRectangle(self.start_point, point)), None)
+            else:
+                self.points.append(point)
+                self._show_points(self.points)
+
+    def canvasReleaseEvent(self, event):
+        if self.mode == self.POLYGON or self.start_point is None or event.button() != Qt.LeftButton:
+            return
+
+        point = QgsPointXY(self.toMapCoordinates(event.pos()))
+        if self.mode == self.RECTANGLE:
+            self._finish(QgsGeometry.fromRect(QgsRectangle(self.start_point, point)))
+        else:
+            self.points.append(point)
+            self._finish(QgsGeometry.fromPolygonXY([self.points + [self.points[0]]]).makeValid())
+
+    def canvasDoubleClickEvent(self, event):
+        if self.mode == self.POLYGON:
+            self._finish_polygon()
+
+    def _finish_polygon(self):
+        if len(self.points) < 3:
+            self.reset()
+            return
+        self._finish(QgsGeometry.fromPolygonXY([self.points + [self.points[0]]]).makeValid())
+
+    def keyPressEvent(self, event):
+        # Escape cancels the area which is being drawn
+        if event.key() == Qt.Key_Escape:
+            self.reset()
+
+    def deactivate(self):
+        self.reset()
+        super().deactivate()
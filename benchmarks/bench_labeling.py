@@ -0,0 +1,307 @@
+"""Headless labeling throughput benchmark for the Binary Labeling Plugin.
+
+It runs BinaryLabelingPlugin under an offscreen QgsApplication with a stub iface, generates synthetic
+polygon or point layers in memory, GeoPackage, shapefile or SpatiaLite, and drives scripted clicks
+through handle_canvas_click. Every case runs in its own process, so the peak memory is its own.
+
+    python benchmarks/bench_labeling.py --sizes 10000,100000 --formats memory,gpkg --output results.json
+
+The results file is a JSON list of cases (sorted, with stable keys) which can be diffed between versions.
+"""
+
+# Imports
+import argparse
+import gc
+import importlib
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORMATS = {
+    # format: (OGR driver name, file extension, dataset options)
+    "memory": (None, None, []),
+    "gpkg": ("GPKG", "gpkg", []),
+    "shapefile": ("ESRI Shapefile", "shp", []),
+    "spatialite": ("SQLite", "sqlite", ["SPATIALITE=YES"]),
+}
+GEOMETRIES = ("polygon", "point")
+CELL = 2.0              # Grid spacing in map units. Polygons are 1 x 1 squares, so neighbours are 1 map unit apart.
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def load_plugin_module(name="binary_labeling_plugin"):
+    # The plugin folder is a package (it uses relative imports), so import it by its folder name
+    if os.path.dirname(PLUGIN_DIR) not in sys.path:
+        sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    return importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.{name}")
+
+
+class StubMessageBar:
+    def __init__(self):
+        self.count = 0
+
+    def pushMessage(self, *args, **kwargs):
+        self.count += 1
+
+
+class StubIface:
+    """The parts of QgisInterface the plugin uses, backed by real widgets where it needs them."""
+
+    def __init__(self):
+        from qgis.PyQt.QtWidgets import QAction, QMainWindow
+        from qgis.gui import QgsMapCanvas
+
+        self.main_window = QMainWindow()
+        self.canvas = QgsMapCanvas(self.main_window)
+        self.canvas.resize(800, 600)
+        self.message_bar = StubMessageBar()
+        self.pan_action = QAction("Pan", self.main_window)
+        self.pan_action.setCheckable(True)
+
+    def mapCanvas(self):
+        return self.canvas
+
+    def mainWindow(self):
+        return self.main_window
+
+    def messageBar(self):
+        return self.message_bar
+
+    def actionPan(self):
+        return self.pan_action
+
+    def addToolBar(self, toolbar):
+        self.main_window.addToolBar(toolbar)
+
+    def addDockWidget(self, area, dock):
+        self.main_window.addDockWidget(area, dock)
+
+    def removeDockWidget(self, dock):
+        self.main_window.removeDockWidget(dock)
+
+    def registerMainWindowAction(self, action, shortcut):
+        action.setShortcut(shortcut)
+        return True
+
+    def unregisterMainWindowAction(self, action):
+        return True
+
+
+def grid_position(i, columns):
+    return (i % columns) * CELL, (i // columns) * CELL
+
+
+def make_feature(i, columns, geometry_type, fields):
+    from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle
+
+    x, y = grid_position(i, columns)
+    feature = QgsFeature(fields)
+    if geometry_type == "polygon":
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + 1.0, y + 1.0)))
+    else:
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x + 0.5, y + 0.5)))
+    feature.setAttributes([i, None])
+    return feature
+
+
+def create_layer(layer_format, geometry_type, size, directory):
+    """Create a synthetic grid layer with an id field and an empty integer label field."""
+    from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsField, QgsFields,
+                           QgsVectorFileWriter, QgsVectorLayer, QgsWkbTypes)
+    from qgis.PyQt.QtCore import QVariant
+
+    columns = int(math.ceil(math.sqrt(size)))
+    crs = QgsCoordinateReferenceSystem("EPSG:3857")
+    fields = QgsFields()
+    fields.append(QgsField("id", QVariant.LongLong))
+    fields.append(QgsField("label", QVariant.Int))
+
+    if layer_format == "memory":
+        layer = QgsVectorLayer(f"{geometry_type.capitalize()}?crs=EPSG:3857&field=id:long&field=label:integer", "bench", "memory")
+        provider = layer.dataProvider()
+        batch = []
+        for i in range(size):
+            batch.append(make_feature(i, columns, geometry_type, layer.fields()))
+            if len(batch) == 50000:
+                provider.addFeatures(batch)
+                batch = []
+        provider.addFeatures(batch)
+        layer.updateExtents()
+        return layer, columns
+
+    driver, extension, dataset_options = FORMATS[layer_format]
+    path = os.path.join(directory, f"bench_{geometry_type}_{size}.{extension}")
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = driver
+    options.datasourceOptions = dataset_options
+    wkb_type = QgsWkbTypes.Polygon if geometry_type == "polygon" else QgsWkbTypes.Point
+    writer = QgsVectorFileWriter.create(path, fields, wkb_type, crs, QgsCoordinateTransformContext(), options)
+    for i in range(size):
+        writer.addFeature(make_feature(i, columns, geometry_type, fields))
+    del writer  # Closes the file
+
+    layer = QgsVectorLayer(path, "bench", "ogr")
+    if not layer.isValid():
+        raise RuntimeError(f"The generated layer: {path} could not be opened.")
+    return layer, columns
+
+
+def run_case(layer_format, geometry_type, size, clicks, seed):
+    """Run one case in this process and return its result row."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication, QgsPointXY, QgsProject, QgsRectangle
+    from qgis.PyQt.QtCore import Qt
+
+    qgs = QgsApplication([], True)
+    qgs.initQgis()
+    plugin_module = load_plugin_module()
+    percentile = load_plugin_module("profiling").percentile
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        layer, columns = create_layer(layer_format, geometry_type, size, directory)
+        generate_seconds = time.perf_counter() - start
+
+        iface = StubIface()
+        canvas = iface.mapCanvas()
+        plugin = plugin_module.BinaryLabelingPlugin(iface)
+        plugin.journal_directory = os.path.join(directory, "journals")     # Keep the journals out of the QGIS profile
+        plugin.initGui()
+        # A background task cannot open a memory layer again from its source, so memory layers are written on the main thread
+        background_writes = layer_format != "memory"
+        plugin.flush_background_check.setChecked(background_writes)
+
+        # Adding the first layer selects it in the layer combobox. That populates the field combobox, builds the hit index
+        # and loads the label state of the first integer field (id), so it is the dominant cost of picking a layer.
+        start = time.perf_counter()
+        QgsProject.instance().addMapLayer(layer)
+        layer_add_seconds = time.perf_counter() - start
+        canvas.setDestinationCrs(layer.crs())
+        canvas.setLayers([layer])
+        canvas.setExtent(QgsRectangle(0, 0, 60 * CELL, 45 * CELL))     # About 60 x 45 features in view
+
+        # Rebuilding the layer combobox keeps the selected layer, so it only refills the field combobox
+        start = time.perf_counter()
+        plugin.layer_combo_update()
+        layer_combo_seconds = time.perf_counter() - start
+
+        # Picking the label field loads its label state; the hit index of the layer is already cached
+        start = time.perf_counter()
+        plugin.field_combo.setCurrentIndex(plugin.field_combo.findText("label"))
+        field_select_seconds = time.perf_counter() - start
+
+        layer.startEditing()
+        plugin.action_button1.setChecked(True)
+        plugin.on_action_button1_triggered()
+
+        # Click on the centers of random features
+        rng = random.Random(seed)
+        targets = [rng.randrange(size) for _ in range(clicks)]
+        latencies = []
+        gc.collect()
+        run_start = time.perf_counter()
+        for i in targets:
+            x, y = grid_position(i, columns)
+            point = QgsPointXY(x + 0.5, y + 0.5)
+            start = time.perf_counter()
+            plugin.handle_canvas_click(point, Qt.LeftButton)
+            latencies.append(time.perf_counter() - start)
+            qgs.processEvents()     # Let timers and finished background writes run, as the QGIS event loop would between clicks
+        start = time.perf_counter()
+        plugin.edit_buffer.flush_sync()
+        final_flush_seconds = time.perf_counter() - start
+        run_seconds = time.perf_counter() - run_start
+
+        plugin.unload()
+        layer.rollBack()
+        QgsProject.instance().removeAllMapLayers()
+
+    latencies.sort()
+    qgs.exitQgis()
+    return {
+        "format": layer_format,
+        "geometry": geometry_type,
+        "size": size,
+        "clicks": clicks,
+        "background_writes": background_writes,
+        "clicks_per_second": round(clicks / run_seconds, 1) if run_seconds else 0.0,
+        "click_p50_ms": round(percentile(latencies, 50) * 1000.0, 3),
+        "click_p95_ms": round(percentile(latencies, 95) * 1000.0, 3),
+        "click_p99_ms": round(percentile(latencies, 99) * 1000.0, 3),
+        "click_max_ms": round(latencies[-1] * 1000.0, 3) if latencies else 0.0,
+        "final_flush_ms": round(final_flush_seconds * 1000.0, 3),
+        "layer_add_ms": round(layer_add_seconds * 1000.0, 3),
+        "layer_combo_update_ms": round(layer_combo_seconds * 1000.0, 3),
+        "field_select_ms": round(field_select_seconds * 1000.0, 3),
+        "generate_seconds": round(generate_seconds, 3),
+        "peak_memory_mb": round(peak_memory_mb(), 1),
+    }
+
+
+def plugin_version():
+    with open(os.path.join(PLUGIN_DIR, "metadata.txt"), encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("version="):
+                return line.split("=", 1)[1].strip()
+    return ""
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PLUGIN_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark labeling throughput across providers and layer sizes.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated feature counts (default: 10000,100000,1000000; up to 10000000)")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"comma separated formats out of {', '.join(FORMATS)}")
+    parser.add_argument("--geometries", default=",".join(GEOMETRIES), help="comma separated geometry types: polygon, point")
+    parser.add_argument("--clicks", type=int, default=1000, help="scripted clicks per case (default: 1000)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the click targets (default: 1)")
+    parser.add_argument("--output", default="bench_results.json", help="results file (default: bench_results.json)")
+    parser.add_argument("--case", help=argparse.SUPPRESS)   # format:geometry:size, used for the per-case child processes
+    args = parser.parse_args(argv)
+
+    if args.case:
+        layer_format, geometry_type, size = args.case.split(":")
+        print(json.dumps(run_case(layer_format, geometry_type, int(size), args.clicks, args.seed)))
+        return 0
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        for layer_format in args.formats.split(","):
+            for geometry_type in args.geometries.split(","):
+                case = f"{layer_format}:{geometry_type}:{size}"
+                print(f"Running {case} ...", file=sys.stderr)
+                completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", case, "--clicks", str(args.clicks), "--seed", str(args.seed)],
+                                           capture_output=True, text=True)
+                if completed.returncode != 0:
+                    print(completed.stderr, file=sys.stderr)
+                    results.append({"format": layer_format, "geometry": geometry_type, "size": size, "error": completed.stderr.strip().splitlines()[-1:]})
+                    continue
+                results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    report = {"plugin_version": plugin_version(), "git_revision": git_revision(), "python": sys.version.split()[0], "cases": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
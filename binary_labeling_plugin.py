@@ -1,22 +1,35 @@
 # Imports
 import os 
-from qgis.PyQt.QtWidgets import QToolBar, QToolButton, QAction, QMenu, QGroupBox, QLabel, QComboBox, QHBoxLayout, QVBoxLayout
-from qgis.PyQt.QtGui import QIcon
-from qgis.core import Qgis, QgsFeatureRequest, QgsRectangle, QgsVectorLayer, QgsMapLayerType
+import time
+from qgis.PyQt.QtWidgets import QToolBar, QToolButton, QAction, QMenu, QGroupBox, QLabel, QComboBox, QHBoxLayout, QVBoxLayout, QSpinBox, QCheckBox, QUndoStack, QFileDialog, QApplication, QKeySequenceEdit
+from qgis.PyQt.QtGui import QIcon, QColor, QKeySequence
+from qgis.core import Qgis, QgsSettings, QgsRectangle, QgsVectorLayer, QgsMapLayerType, QgsCoordinateTransform, QgsProject, QgsGeometry, QgsApplication, QgsTask, QgsFeatureRequest, QgsVectorLayerFeatureSource
 from qgis.PyQt.QtCore import Qt
-from qgis.gui import QgsMapToolEmitPoint, QgsMapTool, QgsMapToolPan
+from qgis.gui import QgsMapToolEmitPoint, QgsMapTool, QgsMapToolPan, QgsRubberBand, QgsGui
+
+from .label_buffer import LabelEditBuffer
+from .spatial_index import LayerHitIndex
+from .area_select_tool import AreaSelectTool
+from .label_history import LabelChangeCommand
+from .labeling_core import LabelingError, apply_label_records, is_integer_field, read_attribute_maps, read_label_records
+from .label_state import UNLABELED, state_of
+from .label_journal import LabelJournal
+from .profiling import LatencyProfiler, ProfilerDock, log
+from .layer_model import LayerFieldModel
+from .label_overlay import LabelOverlay
+from .hover_label_tool import HoverLabelTool
+from .prelabeling import apply_rule
+from .prelabel_dialog import PrelabelDialog
+from .label_export import LabelExporter, pyarrow
+from .labeling_session import LabelingSession
+from .session_dialog import SessionDialog
 
-# TODO: Add the functionality to the plugin which syncs the added or removed fields to be reflected on the select field combobox.
-# TODO: Reflect the added or removed feature to the layer in the field combo box.
 # TODO: When the action button 1 or 1 is checked, if the curser is clicked on somewhere other than the feature, there is an error is raised.
 # The error is message is as follows:
             #       File "C:\Users/salar/AppData/Roaming/QGIS/QGIS3\profiles\default/python/plugins\BinaryLabelingPlugin\binary_labeling_plugin.py", line 289, in handle_canvas_click
             #   print(f"list_features = {list_features[0].attributes()}")
             #  IndexError: list index out of ranges                 >>> the error might because of the list_features is empty since the cursor is clicked on somewhere other than a feature.
 
-# TODO: Create shortcuts for the action buttons. For example, the action button 1 can be assigned to the key "Y" and the action button 2 can be assigned to the key "N".
-# TODO: Check if the shortcuts are working properly with other shortcuts in QGIS. For example, if the action button 1 is assigned to the key "Y", then the "Y" key should not be used for other shortcuts in QGIS.
-
 # Plugin:
 class BinaryLabelingPlugin:
     
@@ -27,12 +40,75 @@ class BinaryLabelingPlugin:
         self.tool = QgsMapToolEmitPoint(self.map_canvas)
         self.tool.canvasClicked.connect(self.handle_canvas_click)
         self.default_tool = QgsMapToolPan(self.map_canvas)
-        self.vector_layers = []  # Store filtered vector layers
+        self.area_tool = AreaSelectTool(self.map_canvas)
+        self.area_tool.areaSelected.connect(self.handle_area_selected)
+        self.hover_tool = HoverLabelTool(self.map_canvas)
+        self.hover_tool.hovered.connect(self.on_hovered)
+        self.hover_tool.left.connect(self.clear_hover)
+        self.layer_model = LayerFieldModel()  # Vector layers of the project and their integer fields, keyed by layer id
+
+        # Label changes are buffered in memory and written to the provider in bulk instead of committing on every click.
+        # There is one buffer per layer, shared by the labeling sessions of the layer, so their writes reach the layer in order.
+        self.buffer_settings = {"max_pending": 50, "idle_ms": 3000, "background": True, "repaint_after_flush": True}
+        self.edit_buffers = {}  # {layer id, or None before a layer is selected: LabelEditBuffer}
+
+        # Named labeling sessions. The comboboxes show and edit the active one, whose buffer and label state are the current ones.
+        self.sessions = {}
+        self.next_session_key = QgsSettings().value("BinaryLabeling/shortcut_next_session", "Ctrl+Alt+L")
+
+        # Crash-safe journals of the label changes, keyed by layer id. Changes are journaled before they are buffered.
+        self.journal_directory = os.path.join(QgsApplication.qgisSettingsDirPath(), "binary_labeling", "journals")
+        self.journals = {}
+        self.journal_marks = {}  # Last journal sequence number of the changes in the flush in progress, keyed by layer id
+
+        # Spatial indexes used for hit-testing clicks, keyed by layer id. Each one is built once when its layer is selected.
+        self.hit_indexes = {}
+        self.tolerance_px = 3  # Click tolerance in screen pixels
+
+        self.prefetch_count = 3  # Number of upcoming unlabeled features whose data is read ahead in the background
+        self.prefetch_task = None
+        self.export_task = None
+
+        # Timings of the phases of every label action. Off until it is switched on in the profiler panel.
+        self.profiler = LatencyProfiler()
+        self.render_started = None
+
+        # Every label action (a click or an area selection) is one command on this undo stack
+        self.undo_stack = QUndoStack()
+        self.area_contained_only = False  # Area selections label intersecting features, or only fully contained ones
+
+        # Hover mode: the features under the cursor, hit-tested against the cached index without reading the provider
+        self.hover_layer = None
+        self.hover_fids = []
+
+        # The default session. Its label state (every feature of the selected layer and field) gives the progress counts and the next unlabeled navigation.
+        self.add_session(LabelingSession("Default"))
+        self.session = self.sessions["Default"]
+        self.label_state = self.session.label_state
+        self.edit_buffer = self.edit_buffer_for(None)
+
+        # Keys which label the hovered feature (or toggle the action buttons outside the hover mode)
+        self.label_keys = {
+            1: QgsSettings().value("BinaryLabeling/shortcut_label1", "Y"),
+            0: QgsSettings().value("BinaryLabeling/shortcut_label0", "N"),
+        }
 
     def initGui(self):
         # Set the map tool when the plugin is loaded
         self.map_canvas.setMapTool(self.tool)
 
+        # The overlay colors the labeled features right away, so the layer is not redrawn after every flush
+        self.label_overlay = LabelOverlay(self.map_canvas)
+        self.overlay_enabled = True
+        self.set_buffer_option("set_repaint_after_flush", "repaint_after_flush", False)
+        self.map_canvas.destinationCrsChanged.connect(self.reset_overlay)
+
+        # The hover highlight of the feature under the cursor
+        self.hover_band = QgsRubberBand(self.map_canvas)
+        self.hover_band.setStrokeColor(QColor(255, 200, 0))
+        self.hover_band.setFillColor(QColor(255, 200, 0, 60))
+        self.hover_band.setWidth(3)
+
         # Create toolbar
         self.toolbar = QToolBar("Binary Labeling Toolbar")
         self.toolbar.setObjectName("Binary Labeling Toolbar")
@@ -63,11 +139,101 @@ class BinaryLabelingPlugin:
         self.toolbar.addAction(self.action_button1)
         self.toolbar.addAction(self.action_button2)
 
-        # Connect to signals for dynamically added or removed layers
-        self.map_canvas.layersChanged.connect(self.layer_combo_update)
+        # Create the selection mode combobox. It decides which map tool is used while one of the action buttons is checked.
+        self.selection_mode_combo = QComboBox(self.iface.mainWindow())
+        self.selection_mode_combo.addItem("Click", None)
+        self.selection_mode_combo.addItem("Rectangle", AreaSelectTool.RECTANGLE)
+        self.selection_mode_combo.addItem("Lasso", AreaSelectTool.LASSO)
+        self.selection_mode_combo.addItem("Polygon", AreaSelectTool.POLYGON)
+        self.selection_mode_combo.addItem("Hover (keys)", HoverLabelTool.HOVER)
+        self.selection_mode_combo.currentIndexChanged.connect(self.on_selection_mode_changed)
+        self.toolbar.addWidget(self.selection_mode_combo)
+
+        # Create the undo and redo actions of the label actions
+        self.undo_action = self.undo_stack.createUndoAction(self.iface.mainWindow(), "Undo label")
+        self.redo_action = self.undo_stack.createRedoAction(self.iface.mainWindow(), "Redo label")
+        self.toolbar.addAction(self.undo_action)
+        self.toolbar.addAction(self.redo_action)
+
+        # Create the next unlabeled action and the label that shows the labeling progress of the selected field
+        self.next_unlabeled_action = QAction("Next unlabeled", self.iface.mainWindow())
+        self.next_unlabeled_action.setToolTip("Go to the next unlabeled feature of the selected layer and field")
+        self.next_unlabeled_action.triggered.connect(self.go_to_next_unlabeled)
+        self.toolbar.addAction(self.next_unlabeled_action)
+
+        self.counts_label = QLabel(self.iface.mainWindow())
+        self.toolbar.addWidget(self.counts_label)
+        self.on_label_counts_changed()
+
+        # Create the import action which applies labels made elsewhere (CSV/GeoJSON records) to the selected layer and field
+        self.import_action = QAction("Import labels...", self.iface.mainWindow())
+        self.import_action.setToolTip("Apply fid/label or x/y/label records from a CSV or GeoJSON file to the selected layer and field")
+        self.import_action.triggered.connect(self.import_labels)
+        self.toolbar.addAction(self.import_action)
+
+        # Create the pre-labeling action which labels every feature matching an expression in one bulk update
+        self.prelabel_action = QAction("Pre-label...", self.iface.mainWindow())
+        self.prelabel_action.setToolTip("Label every feature of the selected layer which matches an expression")
+        self.prelabel_action.triggered.connect(self.prelabel)
+        self.toolbar.addAction(self.prelabel_action)
+
+        # Create the export action which writes the labeled features of the selected field to a training dataset in the background
+        self.export_action = QAction("Export labels...", self.iface.mainWindow())
+        self.export_action.setToolTip("Export the features labeled 0 or 1 in the selected field, only the ones changed since the last export")
+        self.export_action.triggered.connect(self.export_labels)
+        self.toolbar.addAction(self.export_action)
+
+        # Create the profiler panel and the action which shows or hides it
+        self.profiler_dock = ProfilerDock(self.profiler, self.iface.mainWindow())
+        self.iface.addDockWidget(Qt.RightDockWidgetArea, self.profiler_dock)
+        self.profiler_dock.hide()
+        self.profiler_action = self.profiler_dock.toggleViewAction()
+        self.profiler_action.setText("Profiler")
+        self.toolbar.addAction(self.profiler_action)
+        self.map_canvas.renderStarting.connect(self.on_render_starting)
+        self.map_canvas.mapCanvasRefreshed.connect(self.on_canvas_refreshed)
+
+        # Create the flush action which writes the buffered label changes on demand and shows how many are pending.
+        self.flush_action = QAction("Pending: 0", self.iface.mainWindow())
+        self.flush_action.setToolTip("Write the pending label changes to the layer now")
+        self.flush_action.triggered.connect(lambda: self.edit_buffer.flush())
+        self.toolbar.addAction(self.flush_action)
+
+        # Create the session combobox, the actions which add and remove sessions, and the action which switches to the next session
+        self.session_combo = QComboBox(self.iface.mainWindow())
+        self.session_combo.setToolTip("Labeling session: a layer, the fields one label action writes and their values")
+        self.session_combo.addItems(list(self.sessions))
+        self.session_combo.currentTextChanged.connect(self.activate_session)
+        self.toolbar.addWidget(self.session_combo)
+
+        self.new_session_action = QAction("New session...", self.iface.mainWindow())
+        self.new_session_action.triggered.connect(self.new_session)
+        self.toolbar.addAction(self.new_session_action)
+
+        self.remove_session_action = QAction("Remove session", self.iface.mainWindow())
+        self.remove_session_action.setToolTip("Remove the active labeling session (the Default session stays)")
+        self.remove_session_action.triggered.connect(self.remove_session)
+        self.toolbar.addAction(self.remove_session_action)
+
+        self.next_session_action = QAction("Next labeling session", self.iface.mainWindow())
+        self.next_session_action.setObjectName("mActionBinaryLabelNextSession")
+        self.next_session_action.triggered.connect(self.activate_next_session)
+        self.iface.mainWindow().addAction(self.next_session_action)     # Its shortcut only fires once it belongs to a widget
+        self.iface.registerMainWindowAction(self.next_session_action, "")
+        sequence = QKeySequence(self.next_session_key)
+        conflict = self.shortcut_conflict(sequence, self.next_session_action)
+        if conflict is not None:
+            self.iface.messageBar().pushMessage("Shortcut conflict", f"The key: {sequence.toString()} is already used by: {conflict}. Switching sessions has no key now.", level=Qgis.Warning)
+        else:
+            self.next_session_action.setShortcut(sequence)
+
+        # Connect to the layer model, which reports added, removed and renamed layers and changed fields one by one
+        self.layer_model.layerAdded.connect(self.on_model_layer_added)
+        self.layer_model.layerRemoved.connect(self.on_model_layer_removed)
+        self.layer_model.layerRenamed.connect(self.on_model_layer_renamed)
+        self.layer_model.fieldsChanged.connect(self.on_model_fields_changed)
         
         # Connect the currentIndexChanged signal of the layer_combo combobox to the field_combo_populate slot
-        # Note: This will be managed in layer_combo_update to prevent issues
         self.layer_combo.currentIndexChanged.connect(self.field_combo_populate)
 
         # Add the toolbar to the main window
@@ -75,9 +241,8 @@ class BinaryLabelingPlugin:
 
     def create_action_buttons(self):
         # (1) Create the action buttons objects
-        self.action_button1 = QAction(QIcon(self.label_1_icon_path), "Assign 1 (Key: Y)", self.iface.mainWindow())
-        self.action_button2 = QAction(QIcon(self.label_0_icon_path), "Assign 0 (Key: N)", self.iface.mainWindow())
-        # TODO: Add shortcuts to the action buttons   <<<<<<< Attention >>>>>>      <<<<<<< Attention >>>>>>      <<<<<<< Attention >>>>>>     <<<<<<< Attention >>>>>>   <<<<<<< Attention >>>>>>     <<<<<<< Attention >>>>>>    <<<<<<< Attention >>>>>>     <<<<<<< Attention >>>>>>
+        self.action_button1 = QAction(QIcon(self.label_1_icon_path), "Assign 1", self.iface.mainWindow())
+        self.action_button2 = QAction(QIcon(self.label_0_icon_path), "Assign 0", self.iface.mainWindow())
 
         # (2) Make the action buttons checkable
         self.action_button1.setCheckable(True)
@@ -86,6 +251,57 @@ class BinaryLabelingPlugin:
         # (3) Connect the action buttons to their respective methods
         self.action_button1.triggered.connect(self.on_action_button1_triggered)
         self.action_button2.triggered.connect(self.on_action_button2_triggered)
+
+        # (4) Create the key actions. They are separate from the action buttons, since in the hover mode a key labels right away.
+        # Qt only fires the shortcut of an action which belongs to a widget, so they are added to the main window.
+        self.label_key_actions = {}
+        for label in (1, 0):
+            action = QAction(f"Label hovered feature as {label}", self.iface.mainWindow())
+            action.setObjectName(f"mActionBinaryLabel{label}")
+            action.triggered.connect(lambda checked=False, label=label: self.on_label_key(label))
+            self.label_key_actions[label] = action
+            self.iface.mainWindow().addAction(action)
+            self.iface.registerMainWindowAction(action, "")
+            self.set_label_key(label, QKeySequence(self.label_keys[label]))
+
+    def set_label_key(self, label, sequence):
+        # Assign the key to the label action, unless QGIS (or the other label action) already uses it
+        action = self.label_key_actions[label]
+        conflict = self.shortcut_conflict(sequence, action)
+        if conflict is not None:
+            self.iface.messageBar().pushMessage("Shortcut conflict", f"The key: {sequence.toString()} is already used by: {conflict}. The label {label} has no key now, please choose another one.", level=Qgis.Warning)
+            sequence = QKeySequence()
+        action.setShortcut(sequence)
+        self.label_keys[label] = sequence.toString()
+        button = self.action_button1 if label == 1 else self.action_button2
+        button.setText(f"Assign {label} (Key: {self.label_keys[label]})" if self.label_keys[label] else f"Assign {label}")
+        QgsSettings().setValue(f"BinaryLabeling/shortcut_label{label}", self.label_keys[label])
+
+        key_text = sequence.toString(QKeySequence.NativeText) or "none"
+        (self.action_button1 if label == 1 else self.action_button2).setText(f"Assign {label} (Key: {key_text})")
+
+    def shortcut_conflict(self, sequence, own_action):
+        # Return the name of the action or shortcut which already uses the key sequence, or None
+        if sequence.isEmpty():
+            return None
+        for action in self.iface.mainWindow().findChildren(QAction):
+            if action is not own_action and any(s.matches(sequence) == QKeySequence.ExactMatch for s in action.shortcuts()):
+                return action.text().replace("&", "")
+        manager = QgsGui.shortcutsManager()
+        action = manager.actionForSequence(sequence)
+        if action is not None and action is not own_action:
+            return action.text().replace("&", "")
+        shortcut = manager.shortcutForSequence(sequence)
+        if shortcut is not None:
+            return shortcut.objectName() or shortcut.whatsThis()
+        return None
+
+    def on_label_key(self, label):
+        # In the hover mode the key labels the feature under the cursor, otherwise it toggles the matching action button
+        if self.selection_mode_combo.currentData() == HoverLabelTool.HOVER:
+            self.label_hovered(label)
+        else:
+            (self.action_button1 if label == 1 else self.action_button2).trigger()
     
     def on_action_button1_triggered(self):
         if self.action_button2.isChecked():
@@ -94,8 +310,7 @@ class BinaryLabelingPlugin:
         # Set the cursor to cross cursor if one of the action buttons is checked, otherwise set it to arrow cursor
         if self.action_button1.isChecked() or self.action_button2.isChecked():
             self.map_canvas.setCursor(Qt.CrossCursor)
-            self.tool.canvasClicked.connect(self.handle_canvas_click)
-            self.map_canvas.setMapTool(self.tool)
+            self.map_canvas.setMapTool(self.current_label_tool())
 
         if not self.action_button1.isChecked() and not self.action_button2.isChecked():
             self.map_canvas.setCursor(Qt.ArrowCursor)
@@ -109,14 +324,34 @@ class BinaryLabelingPlugin:
         # Set the cursor to cross cursor if one of the action buttons is checked, otherwise set it to arrow cursor
         if self.action_button1.isChecked() or self.action_button2.isChecked():
             self.map_canvas.setCursor(Qt.CrossCursor)
-            self.tool.canvasClicked.connect(self.handle_canvas_click)
-            self.map_canvas.setMapTool(self.tool)
+            self.map_canvas.setMapTool(self.current_label_tool())
 
         if not self.action_button1.isChecked() and not self.action_button2.isChecked():
             self.map_canvas.setCursor(Qt.ArrowCursor)
             self.map_canvas.setMapTool(self.default_tool)
             self.iface.actionPan().setChecked(True)
      
+    def current_label_tool(self):
+        # The click tool labels one feature per click, the area tool labels every feature in the drawn area and the hover tool follows the cursor
+        mode = self.selection_mode_combo.currentData()
+        if mode is None:
+            return self.tool
+        if mode == HoverLabelTool.HOVER:
+            return self.hover_tool
+        self.area_tool.set_mode(mode)
+        return self.area_tool
+
+    def on_selection_mode_changed(self):
+        # The hover mode needs no action button: the keys decide the label, so its tool is active right away
+        if self.selection_mode_combo.currentData() == HoverLabelTool.HOVER:
+            self.deactivate_action_buttons()
+            self.map_canvas.setMapTool(self.hover_tool)
+        elif self.action_button1.isChecked() or self.action_button2.isChecked():
+            self.map_canvas.setMapTool(self.current_label_tool())
+        elif self.map_canvas.mapTool() is self.hover_tool:
+            self.map_canvas.setMapTool(self.default_tool)
+            self.iface.actionPan().setChecked(True)
+
     def deactivate_other_toolbar_buttons(self):
         # List of action object names to exclude
         exclude_actions = ['mActionToggleEditing', 'toolboxAction', 'mActionShowPythonDialog']
@@ -137,49 +372,42 @@ class BinaryLabelingPlugin:
         # Create a new map tool
         new_map_tool = QgsMapToolPan(self.iface.map_canvas)
                 
-    def get_vector_layers(self):
-        """Safely get only vector layers from the map canvas"""
-        vector_layers = []
-        try:
-            all_layers = self.iface.mapCanvas().layers()
-            for layer in all_layers:
-                if hasattr(layer, 'type') and hasattr(layer, 'fields'):
-                    # Additional check to ensure it has the fields() method
-                    if (isinstance(layer, QgsVectorLayer) and 
-                        layer.type() == QgsMapLayerType.VectorLayer and
-                        callable(getattr(layer, 'fields', None))):
-                        vector_layers.append(layer)
-        except Exception as e:
-            print(f"Error getting vector layers: {e}")
-        return vector_layers
+    def selected_layer(self):
+        # The layer combobox stores the layer id of every item
+        return self.layer_model.layer(self.layer_combo.currentData())
 
     def layer_combo_update(self):
-        # Temporarily disconnect the signal to prevent recursive calls
-        try:
-            self.layer_combo.currentIndexChanged.disconnect()
-        except:
-            pass  # Signal might not be connected yet
-        
-        # Clear the layer combo box
+        # Rebuild the layer combobox from the layer model, keeping the selected layer. The model signals keep it current afterwards.
+        current_id = self.layer_combo.currentData()
+        self.layer_combo.blockSignals(True)
         self.layer_combo.clear()
+        for layer_id in self.layer_model.layer_ids():
+            self.layer_combo.addItem(self.layer_model.layer(layer_id).name(), layer_id)
+        self.layer_combo.setCurrentIndex(self.layer_combo.findData(current_id) if current_id is not None else -1)
+        self.layer_combo.blockSignals(False)
 
-        # Get only vector layers using the safe method
-        self.vector_layers = self.get_vector_layers()
-        
-        print(f"Found {len(self.vector_layers)} vector layers")
-        for layer in self.vector_layers:
-            print(f"Vector layer: {layer.name()}")
+        log.debug("Found %d vector layers", self.layer_combo.count())
+        self.field_combo_populate()
 
-        # Add the names of the vector layers to the layer_combo
-        if self.vector_layers:
-            self.layer_combo.addItems([layer.name() for layer in self.vector_layers])
+    def on_model_layer_added(self, layer_id):
+        # Adding the first item selects it, which populates the field combobox through currentIndexChanged
+        self.layer_combo.addItem(self.layer_model.layer(layer_id).name(), layer_id)
+
+    def on_model_layer_removed(self, layer_id):
+        # Removing the selected item moves the selection, which populates the field combobox through currentIndexChanged
+        index = self.layer_combo.findData(layer_id)
+        if index >= 0:
+            self.layer_combo.removeItem(index)
+
+    def on_model_layer_renamed(self, layer_id):
+        index = self.layer_combo.findData(layer_id)
+        if index >= 0:
+            self.layer_combo.setItemText(index, self.layer_model.layer(layer_id).name())
+
+    def on_model_fields_changed(self, layer_id):
+        if layer_id == self.layer_combo.currentData():
+            self.field_combo_populate()
 
-        # Reconnect the signal
-        self.layer_combo.currentIndexChanged.connect(self.field_combo_populate)
-        
-        # Call the field_combo_populate method only if we have vector layers
-        self.field_combo_populate()
-        
     def create_settings_menu(self):
         # Create a new menu
         self.settings_menu = QMenu(self.iface.mainWindow())
@@ -193,11 +421,9 @@ class BinaryLabelingPlugin:
         self.layer_combo = QComboBox(self.group_box)
         self.layer_combo.setMinimumWidth(400)
         
-        # Initialize vector_layers and populate combo
-        self.vector_layers = self.get_vector_layers()
-        
-        if self.vector_layers:
-            self.layer_combo.addItems([layer.name() for layer in self.vector_layers])
+        # Populate the combo from the layer model
+        for layer_id in self.layer_model.layer_ids():
+            self.layer_combo.addItem(self.layer_model.layer(layer_id).name(), layer_id)
         self.layer_combo.setCurrentIndex(-1)
         
         # Creat QHBox Layout for the layer label & layer combobox.
@@ -211,16 +437,109 @@ class BinaryLabelingPlugin:
         self.field_combo = QComboBox(self.group_box)
         self.field_combo.setMinimumWidth(400)
         self.field_combo.setCurrentIndex(-1)
+        self.field_combo.currentIndexChanged.connect(lambda: self.load_label_state())
 
         # Create QHBox Layout for the field label & field combobox.
         self.box2_layout = QHBoxLayout()
         self.box2_layout.addWidget(self.field_label)
         self.box2_layout.addWidget(self.field_combo)
 
+        # (3) Write-behind buffer settings (flush after N pending changes or after the labeler is idle for N seconds)
+        self.flush_count_label = QLabel("Write after pending changes:", self.group_box)
+        self.flush_count_spin = QSpinBox(self.group_box)
+        self.flush_count_spin.setRange(1, 100000)
+        self.flush_count_spin.setValue(self.buffer_settings["max_pending"])
+        self.flush_count_spin.valueChanged.connect(lambda count: self.set_buffer_option("set_max_pending", "max_pending", count))
+
+        self.flush_idle_label = QLabel("Write after idle seconds (0 = never):", self.group_box)
+        self.flush_idle_spin = QSpinBox(self.group_box)
+        self.flush_idle_spin.setRange(0, 3600)
+        self.flush_idle_spin.setValue(self.buffer_settings["idle_ms"] // 1000)
+        self.flush_idle_spin.valueChanged.connect(lambda seconds: self.set_buffer_option("set_idle_ms", "idle_ms", seconds * 1000))
+
+        self.flush_background_check = QCheckBox("Write in background", self.group_box)
+        self.flush_background_check.setChecked(self.buffer_settings["background"])
+        self.flush_background_check.toggled.connect(lambda background: self.set_buffer_option("set_background", "background", background))
+
+        self.overlay_check = QCheckBox("Show labels as overlay (no layer redraw)", self.group_box)
+        self.overlay_check.setChecked(True)
+        self.overlay_check.toggled.connect(self.set_overlay_enabled)
+
+        # Create QHBox Layout for the buffer settings.
+        self.box3_layout = QHBoxLayout()
+        self.box3_layout.addWidget(self.flush_count_label)
+        self.box3_layout.addWidget(self.flush_count_spin)
+        self.box3_layout.addWidget(self.flush_idle_label)
+        self.box3_layout.addWidget(self.flush_idle_spin)
+        self.box3_layout.addWidget(self.flush_background_check)
+        self.box3_layout.addWidget(self.overlay_check)
+
+        # (4) Click tolerance in screen pixels
+        self.tolerance_label = QLabel("Click tolerance (pixels):", self.group_box)
+        self.tolerance_spin = QSpinBox(self.group_box)
+        self.tolerance_spin.setRange(0, 50)
+        self.tolerance_spin.setValue(self.tolerance_px)
+        self.tolerance_spin.valueChanged.connect(self.set_tolerance_px)
+
+        # Create QHBox Layout for the tolerance label & tolerance spinbox.
+        self.box4_layout = QHBoxLayout()
+        self.box4_layout.addWidget(self.tolerance_label)
+        self.box4_layout.addWidget(self.tolerance_spin)
+
+        # (5) Area selection rule (label every intersecting feature or only the fully contained ones)
+        self.area_rule_label = QLabel("Area selection labels:", self.group_box)
+        self.area_rule_combo = QComboBox(self.group_box)
+        self.area_rule_combo.addItems(["Intersecting features", "Contained features"])
+        self.area_rule_combo.currentIndexChanged.connect(lambda index: setattr(self, "area_contained_only", index == 1))
+
+        # Create QHBox Layout for the area rule label & area rule combobox.
+        self.box5_layout = QHBoxLayout()
+        self.box5_layout.addWidget(self.area_rule_label)
+        self.box5_layout.addWidget(self.area_rule_combo)
+
+        # (6) Keys which label the hovered feature
+        self.key1_label = QLabel("Key for 1:", self.group_box)
+        self.key1_edit = QKeySequenceEdit(QKeySequence(self.label_keys[1]), self.group_box)
+        self.key1_edit.editingFinished.connect(lambda: self.on_key_edited(1, self.key1_edit))
+        self.key0_label = QLabel("Key for 0:", self.group_box)
+        self.key0_edit = QKeySequenceEdit(QKeySequence(self.label_keys[0]), self.group_box)
+        self.key0_edit.editingFinished.connect(lambda: self.on_key_edited(0, self.key0_edit))
+
+        # Create QHBox Layout for the key labels & key edits.
+        self.box6_layout = QHBoxLayout()
+        self.box6_layout.addWidget(self.key1_label)
+        self.box6_layout.addWidget(self.key1_edit)
+        self.box6_layout.addWidget(self.key0_label)
+        self.box6_layout.addWidget(self.key0_edit)
+
+        # (7) Training dataset export settings
+        self.export_format_label = QLabel("Export format:", self.group_box)
+        self.export_format_combo = QComboBox(self.group_box)
+        if pyarrow is not None:
+            self.export_format_combo.addItem("GeoParquet", "parquet")
+        self.export_format_combo.addItem("CSV + WKB", "csv")
+        self.export_val_label = QLabel("Validation %:", self.group_box)
+        self.export_val_spin = QSpinBox(self.group_box)
+        self.export_val_spin.setRange(0, 99)
+        self.export_balance_check = QCheckBox("Balance classes", self.group_box)
+
+        # Create QHBox Layout for the export settings.
+        self.box7_layout = QHBoxLayout()
+        self.box7_layout.addWidget(self.export_format_label)
+        self.box7_layout.addWidget(self.export_format_combo)
+        self.box7_layout.addWidget(self.export_val_label)
+        self.box7_layout.addWidget(self.export_val_spin)
+        self.box7_layout.addWidget(self.export_balance_check)
+
         # Create a layout for the group box
         self.group_box_layout = QVBoxLayout()
         self.group_box_layout.addLayout(self.box1_layout) 
         self.group_box_layout.addLayout(self.box2_layout)
+        self.group_box_layout.addLayout(self.box3_layout)
+        self.group_box_layout.addLayout(self.box4_layout)
+        self.group_box_layout.addLayout(self.box5_layout)
+        self.group_box_layout.addLayout(self.box6_layout)
+        self.group_box_layout.addLayout(self.box7_layout)
         self.group_box.setLayout(self.group_box_layout)   # Set the layout of the group box to the group_box_layout
 
         # Add the group box to the settings menu
@@ -228,111 +547,609 @@ class BinaryLabelingPlugin:
         self.menu_layout.addWidget(self.group_box)
         self.settings_menu.setLayout(self.menu_layout)
         
+    def on_key_edited(self, label, edit):
+        self.set_label_key(label, edit.keySequence())
+        edit.setKeySequence(QKeySequence(self.label_keys[label]))        # Shows the key was refused on a conflict
+
     def field_combo_populate(self):
-        # Clear the field combo box
+        # Fill the field combo box with the integer fields of the selected layer, keeping the selected field if the layer has it too
+        selected_layer = self.selected_layer()
+        current_field = self.field_combo.currentText()
+        log.debug("field_combo_populate called. Current index: %d", self.layer_combo.currentIndex())
+
+        self.field_combo.blockSignals(True)
         self.field_combo.clear()
-        
-        print(f"field_combo_populate called. Current index: {self.layer_combo.currentIndex()}, Vector layers count: {len(self.vector_layers)}")
+        if selected_layer is not None:
+            field_names = self.layer_model.fields_of(selected_layer.id())
+            self.field_combo.addItems(field_names)
+            if current_field in field_names:
+                self.field_combo.setCurrentIndex(field_names.index(current_field))
+            log.debug("Added %d integer fields of the layer %s to combo", len(field_names), selected_layer.name())
 
-        # Check if there is a valid selection in the layer_combo and we have vector layers
-        if (self.layer_combo.currentIndex() >= 0 and 
-            len(self.vector_layers) > 0 and
-            self.layer_combo.currentIndex() < len(self.vector_layers)):
-            
-            # Get the selected layer from the stored vector_layers list
-            selected_layer = self.vector_layers[self.layer_combo.currentIndex()]
-            print(f"Selected layer: {selected_layer.name()}, Type: {type(selected_layer).__name__}")
-            
-            # Double-check that this is indeed a vector layer
-            if isinstance(selected_layer, QgsVectorLayer) and selected_layer.type() == QgsMapLayerType.VectorLayer:
-                # Add the field names to the field combo box (self.field_combo)
-                self.field_combo.addItems([field.name() for field in selected_layer.fields()])
-                print(f"Added {len(selected_layer.fields())} fields to combo")
-            else:
-                print(f"Warning: Layer {selected_layer.name()} is not a vector layer")
+            # Build the hit-test index now, so the first click does not pay for it
+            self.get_hit_index(selected_layer)
+        else:
+            log.debug("No valid layer selection or no vector layers available")
+        self.field_combo.blockSignals(False)
+
+        self.load_label_state()
+
+    def load_label_state(self, force=False):
+        # Point the active session at the selected layer and field, and load its label state (one attribute-only pass over the layer)
+        selected_layer = self.selected_layer()
+        field_index = -1
+        if selected_layer is not None and self.field_combo.currentIndex() >= 0:
+            field_index = selected_layer.fields().indexFromName(self.field_combo.currentText())
+            if field_index < 0 or not is_integer_field(selected_layer.fields().at(field_index)):
+                selected_layer, field_index = None, -1
+
+        field_name = selected_layer.fields().at(field_index).name() if field_index >= 0 else None
+
+        # The comboboxes only edit the Default session. Picking another layer or field while a named session is active
+        # switches to Default, so the named session keeps its layer and the extra fields it writes.
+        if self.session.name != "Default" and (selected_layer is not self.session.layer or field_name != self.session.primary_field()):
+            self.bind_session(self.sessions["Default"])
+            self.session_combo.blockSignals(True)
+            self.session_combo.setCurrentIndex(self.session_combo.findText("Default"))
+            self.session_combo.blockSignals(False)
+            self.on_label_counts_changed()
+            self.on_pending_count_changed()
+
+        # Nothing to do when the layer and field did not change
+        if not force and selected_layer is self.label_state.layer and field_index == self.label_state.field_index:
+            return
+
+        if self.session.name == "Default":
+            self.session.set_target(selected_layer, field_name)
+        self.edit_buffer = self.edit_buffer_for(selected_layer)
+        self.on_pending_count_changed()
+
+        # Pending changes must not be counted against the newly loaded state
+        self.edit_buffer.flush_sync()
+        self.reset_overlay()
+        self.clear_hover()
+        if selected_layer is not None:
+            self.replay_journal(selected_layer)
+        self.label_state.load(selected_layer, field_index)
+
+    def edit_buffer_for(self, layer):
+        # Return the write-behind buffer of the layer, creating it with the current buffer settings on first use
+        layer_id = layer.id() if layer is not None else None
+        edit_buffer = self.edit_buffers.get(layer_id)
+        if edit_buffer is None:
+            edit_buffer = LabelEditBuffer(self.buffer_settings["max_pending"], self.buffer_settings["idle_ms"], self.buffer_settings["background"])
+            edit_buffer.set_repaint_after_flush(self.buffer_settings["repaint_after_flush"])
+            edit_buffer.set_layer(layer)
+            edit_buffer.pendingCountChanged.connect(self.on_pending_count_changed)
+            edit_buffer.writingChanged.connect(self.on_pending_count_changed)
+            edit_buffer.flushFailed.connect(self.on_flush_failed)
+            edit_buffer.flushed.connect(self.on_flushed)
+            edit_buffer.flushStarted.connect(self.on_flush_started)
+            edit_buffer.conflictsDetected.connect(self.on_conflicts_detected)
+            edit_buffer.featuresMissing.connect(self.on_features_missing)
+            edit_buffer.changesQueued.connect(self.on_changes_queued_sessions)
+            edit_buffer.changesQueued.connect(self.on_changes_queued_overlay)
+            self.edit_buffers[layer_id] = edit_buffer
+        return edit_buffer
+
+    def set_buffer_option(self, setter, key, value):
+        # The buffer settings apply to the buffers of every layer, and to the ones created later
+        self.buffer_settings[key] = value
+        for edit_buffer in self.edit_buffers.values():
+            getattr(edit_buffer, setter)(value)
+
+    def on_changes_queued_sessions(self, layer, changes):
+        # Every session keeps its own label state current. The sessions of other layers ignore the changes.
+        for session in self.sessions.values():
+            session.label_state.on_changes_queued(layer, changes)
+
+    def add_session(self, session):
+        self.sessions[session.name] = session
+        session.label_state.countsChanged.connect(self.on_label_counts_changed)
+        if session.layer is not None:
+            self.get_hit_index(session.layer)            # Built now, so the first click of the session does not pay for it
+        if hasattr(self, "session_combo"):
+            self.session_combo.addItem(session.name)
+
+    def new_session(self):
+        dialog = SessionDialog(self.layer_model, self.sessions, self.iface.mainWindow())
+        if not dialog.exec_():
+            return
+        self.add_session(LabelingSession(dialog.name(), dialog.layer(), dialog.field_values()))
+        self.session_combo.setCurrentIndex(self.session_combo.findText(dialog.name()))       # Activates it
+
+    def remove_session(self):
+        session = self.session
+        if session.name == "Default":
+            return
+        self.session_combo.setCurrentIndex(self.session_combo.findText("Default"))
+        session.label_state.disconnect_layer()
+        session.label_state.countsChanged.disconnect(self.on_label_counts_changed)
+        del self.sessions[session.name]
+        self.session_combo.removeItem(self.session_combo.findText(session.name))
+
+    def activate_next_session(self):
+        self.session_combo.setCurrentIndex((self.session_combo.currentIndex() + 1) % self.session_combo.count())
+
+    def bind_session(self, session):
+        # Switching only swaps references: the session keeps its label state, and the buffer and hit index of its layer stay cached
+        self.reset_overlay()
+        self.clear_hover()
+        self.session = session
+        self.label_state = session.label_state
+        self.edit_buffer = self.edit_buffer_for(session.layer)
+
+    def activate_session(self, name):
+        session = self.sessions.get(name)
+        if session is None or session is self.session:
+            return
+        self.bind_session(session)
+
+        # The label state is loaded on the first activation, and again after the layer was written in bulk (import, pre-labeling)
+        if session.layer is not None and session.label_state.layer is not session.layer:
+            self.edit_buffer.flush_sync()
+            session.label_state.load(session.layer, session.layer.fields().indexFromName(session.primary_field()))
+
+        # Show the session in the comboboxes without going through their change handlers
+        self.layer_combo.blockSignals(True)
+        self.layer_combo.setCurrentIndex(self.layer_combo.findData(session.layer.id()) if session.layer is not None else -1)
+        self.layer_combo.blockSignals(False)
+        self.field_combo.blockSignals(True)
+        self.field_combo.clear()
+        if session.layer is not None:
+            self.field_combo.addItems(self.layer_model.fields_of(session.layer.id()))
+            self.field_combo.setCurrentIndex(self.field_combo.findText(session.primary_field()))
+        self.field_combo.blockSignals(False)
+
+        self.on_label_counts_changed()
+        self.on_pending_count_changed()
+        log.debug("Switched to the labeling session %s", name)
+
+    def invalidate_label_states(self, layer):
+        # The layer was written around the buffers: the other sessions of the layer reload their label state when they are activated
+        for session in self.sessions.values():
+            if session is not self.session and session.label_state.layer is layer:
+                session.label_state.load(None, -1)
+
+    def set_overlay_enabled(self, enabled):
+        self.overlay_enabled = enabled
+        self.set_buffer_option("set_repaint_after_flush", "repaint_after_flush", not enabled)
+        self.reset_overlay()
+
+    def reset_overlay(self):
+        # Drop the overlay and redraw the layer once, so it shows what the overlay showed
+        if not hasattr(self, "label_overlay"):
+            return
+        if self.label_overlay.features and self.label_state.layer is not None:
+            self.label_state.layer.triggerRepaint()
+        self.label_overlay.clear()
+
+    def on_changes_queued_overlay(self, layer, changes):
+        # Show the queued labels of the selected layer and field on the overlay, one feature at a time
+        if not self.overlay_enabled or layer is None or layer is not self.label_state.layer:
+            return
+        field_index = self.label_state.field_index
+        hit_index = self.get_hit_index(layer)
+        transform = None
+        if layer.crs() != self.map_canvas.mapSettings().destinationCrs():
+            transform = QgsCoordinateTransform(layer.crs(), self.map_canvas.mapSettings().destinationCrs(), QgsProject.instance())
+
+        for fid, attributes in changes.items():
+            if field_index not in attributes:
+                continue
+            geometry = QgsGeometry(hit_index.geometry(fid))
+            if transform is not None and not geometry.isNull():
+                geometry.transform(transform)
+            self.label_overlay.set_state(fid, geometry, state_of(attributes[field_index]))
+
+    def on_label_counts_changed(self):
+        if not hasattr(self, "counts_label"):
+            return
+        counts = self.label_state.counts
+        total = self.label_state.total()
+        if total == 0:
+            self.counts_label.setText("")
+            return
+        labeled = counts[0] + counts[1]
+        self.counts_label.setText(f" 1: {counts[1]}  0: {counts[0]}  unlabeled: {counts[UNLABELED]}  ({100.0 * labeled / total:.1f}% done) ")
+
+    def go_to_next_unlabeled(self):
+        layer = self.label_state.layer
+        if layer is None:
+            self.iface.messageBar().pushMessage("No valid layer or field selected", "Please select a valid layer and an integer field.", level=Qgis.Warning)
+            return
+
+        # The Hilbert order keeps consecutive features close together, so the canvas moves in small steps
+        hit_index = self.get_hit_index(layer)
+        if self.label_state.hilbert_order is None:
+            self.label_state.build_hilbert_order(hit_index.geometry, layer.extent())
+
+        fids = self.label_state.next_unlabeled(1 + self.prefetch_count)
+        if not fids:
+            self.iface.messageBar().pushMessage("All features are labeled", f"Every feature of the layer: {layer.name()} has a label.", level=Qgis.Info)
+            return
+
+        geometry = hit_index.geometry(fids[0])
+        rect = self.map_canvas.mapSettings().layerToMapCoordinates(layer, geometry.boundingBox())
+        extent = self.map_canvas.extent()
+        if rect.width() < extent.width() * 0.8 and rect.height() < extent.height() * 0.8:
+            self.map_canvas.setCenter(rect.center())                    # Keep the scale while the feature fits
         else:
-            print("No valid layer selection or no vector layers available")
-                        
+            rect.scale(1.5)
+            self.map_canvas.setExtent(rect)
+        self.map_canvas.refresh()
+        self.map_canvas.flashGeometries([geometry], layer.crs())
+
+        self.prefetch_features(layer, [hit_index.geometry(fid).boundingBox() for fid in fids[1:]])
+
+    def prefetch_features(self, layer, rects):
+        # Read the features around the next unlabeled ones in a background task, so their pages are warm in the provider and OS caches
+        if not rects or (self.prefetch_task is not None and self.prefetch_task.status() in (QgsTask.Queued, QgsTask.Running)):
+            return
+        source = QgsVectorLayerFeatureSource(layer)      # Feature sources are safe to iterate from another thread
+
+        def read_rects(task):
+            for rect in rects:
+                for _ in source.getFeatures(QgsFeatureRequest().setFilterRect(rect)):
+                    if task.isCanceled():
+                        return
+
+        self.prefetch_task = QgsTask.fromFunction("Prefetch next unlabeled features", read_rects, flags=QgsTask.Silent)
+        self.forget_task_when_ended("prefetch_task", self.prefetch_task)
+        QgsApplication.taskManager().addTask(self.prefetch_task)
+
+    def forget_task_when_ended(self, attribute, task):
+        # QgsTaskManager deletes a task once it ended, after which its wrapper raises. Drop the reference held in the attribute before that.
+        def forget():
+            if getattr(self, attribute) is task:
+                setattr(self, attribute, None)
+        task.taskCompleted.connect(forget)
+        task.taskTerminated.connect(forget)
+
+    def on_hovered(self, point):
+        # Hit-test the cursor position from the cached index and highlight the features under it
+        layer = self.label_state.layer
+        if layer is None:
+            self.clear_hover()
+            return
+        with self.profiler.measure("hover_hit_test", layer):
+            fids = self.hit_test(layer, point)
+        if layer is self.hover_layer and fids == self.hover_fids:
+            return
+
+        self.hover_layer = layer
+        self.hover_fids = fids
+        hit_index = self.get_hit_index(layer)
+        self.hover_band.reset(layer.geometryType())
+        for fid in fids:
+            self.hover_band.addGeometry(hit_index.geometry(fid), layer, False)
+        self.hover_band.updatePosition()
+        self.hover_band.update()
+
+    def clear_hover(self):
+        self.hover_layer = None
+        self.hover_fids = []
+        if hasattr(self, "hover_band"):
+            self.hover_band.reset()
+
+    def label_hovered(self, label):
+        start = time.perf_counter()
+        selected_layer, selected_field = self.get_label_target()
+        if selected_layer is None:
+            return
+        if not self.hover_fids or selected_layer is not self.hover_layer:
+            self.iface.messageBar().pushMessage("No feature found", "No feature is under the cursor.", level=Qgis.Warning)
+            return
+
+        # No message per key press: the overlay shows the new label, and a message would slow down fast labelers.
+        # Hovering itself never reads from the provider; the previous values are only read here, once per key press.
+        self.apply_label(selected_layer, selected_field, self.hover_fids, label)
+        self.profiler.record("key_total", selected_layer, time.perf_counter() - start)
+
     def handle_canvas_click(self, point, button):
+        if button != Qt.LeftButton:
+            return
 
-        if self.action_button1.isChecked() and button == Qt.LeftButton:                              # if the action_button1 is checked and the left mouse button is clicked
-            label = 1
-            # Get the layer and field names from the comboboxes
-            selected_layer, selected_field = self.get_layer_and_field()                              # Get layer and field
-            print(f"Selected layer: {selected_layer.name()}")
-            print(f"Selected field: {selected_field}")
+        if self.action_button1.isChecked():                                                          # if the action_button1 is checked, the clicked feature gets the label 1
+            self.label_at_point(point, 1)
+        elif self.action_button2.isChecked():                                                        # if the action_button2 is checked, the clicked feature gets the label 0
+            self.label_at_point(point, 0)
 
-            if selected_layer and selected_field:                                                    # Validate the layer and field names not to be None
-                
-                if selected_layer.fields().field(selected_field).type() == 4:                        # Check if the field is of type integer
-                    
-                    if selected_layer.isEditable():                                                  # Check if the layer is in editing mode
-                        tolerance = 0.01
-                        rect = QgsRectangle(point.x() - tolerance, point.y() - tolerance, point.x() + tolerance, point.y() + tolerance)
-                        request = QgsFeatureRequest().setFilterRect(rect)
-                        features = selected_layer.getFeatures(request)
-                        list_features = list(features)
-                        print(f"lenght of features = {len(list_features)}")
-                        
-                        # Fix for the IndexError - check if list_features is not empty before accessing
-                        if list_features:
-                            print(f"list_features = {list_features[0].attributes()}")
-                            # Get the first identified feature
-                            selected_layer.startEditing()          # Start editing the layer
-                            for feature in list_features:
-                                selected_layer.changeAttributeValue(feature.id(), selected_layer.fields().indexFromName(selected_field), label)
-                            
-                            selected_layer.commitChanges()            # Commit the changes to the layer
-                            selected_layer.startEditing()              # Stop editing the layer
-                            self.iface.messageBar().pushMessage("Feature updated", f"Feature with id: {feature.attribute('id')} has been updated with the value: {label} in the field: {selected_field}.", level=Qgis.Success)
-                            
-                        else:
-                            self.iface.messageBar().pushMessage("No feature found", "No feature was found at the clicked point.", level=Qgis.Warning)
-                    elif not selected_layer.isEditable():
-                        self.iface.messageBar().pushMessage("Editing mode is off", f"The selected layer is not in editing mode. Please enable the editing mode for the selected layer={selected_layer}.", level=Qgis.Warning)
-                else:
-                    self.iface.messageBar().pushMessage("Field type is not integer", f"The selected field: {selected_field} is not of type integer. Please select a field of type integer.", level=Qgis.Warning)
-            else:
-                self.iface.messageBar().pushMessage("No valid layer or field selected", "Please select a valid layer and field.", level=Qgis.Warning)
-
-
-        elif self.action_button2.isChecked() and button == Qt.LeftButton:
-            label = 0
-            # Get the layer and field names from the comboboxes
-            selected_layer, selected_field = self.get_layer_and_field()                              # Get layer and field
-
-            if selected_layer and selected_field:                                                    # Validate the layer and field names not to be None
-
-                if selected_layer.fields().field(selected_field).type() == 4:                        # Check if the field is of type integer
-
-                    if selected_layer.isEditable():                                                  # Check if the layer is in editing mode
-                        tolerance = 0.01
-                        rect = QgsRectangle(point.x() - tolerance, point.y() - tolerance, point.x() + tolerance, point.y() + tolerance)
-                        request = QgsFeatureRequest().setFilterRect(rect)
-                        features = selected_layer.getFeatures(request)
-                        list_features = list(features)
-                        print(f"lenght of features = {len(list_features)}")
-                        
-                        # Fix for the IndexError - check if list_features is not empty before accessing
-                        if list_features:
-                            print(f"list_features = {list_features[0].attributes()}")
-                            # Get the first identified feature
-                            selected_layer.startEditing()          # Start editing the layer
-                            for feature in list_features:
-                                selected_layer.changeAttributeValue(feature.id(), selected_layer.fields().indexFromName(selected_field), label)
-                            
-                            selected_layer.commitChanges()            # Commit the changes to the layer
-                            selected_layer.startEditing()              # Stop editing the layer
-                            self.iface.messageBar().pushMessage("Feature updated", f"Feature with id: {feature.attribute('id')} has been updated with the value: {label} in the field: {selected_field}.", level=Qgis.Success)
-                        else:
-                            self.iface.messageBar().pushMessage("No feature found", "No feature was found at the clicked point.", level=Qgis.Warning)
-                    
-                    elif not selected_layer.isEditable():
-                        self.iface.messageBar().pushMessage("Editing mode is off", f"The selected layer is not in editing mode. Please enable the editing mode for the selected layer={selected_layer}.", level=Qgis.Warning)
-                else:
-                    self.iface.messageBar().pushMessage("Field type is not integer", f"The selected field: {selected_field} is not of type integer. Please select a field of type integer.", level=Qgis.Warning)
-            else:
-                self.iface.messageBar().pushMessage("No valid layer or field selected", "Please select a valid layer and field.", level=Qgis.Warning)
+    def handle_area_selected(self, area):
+        if self.action_button1.isChecked():                                                          # if the action_button1 is checked, the selected features get the label 1
+            self.label_in_area(area, 1)
+        elif self.action_button2.isChecked():                                                        # if the action_button2 is checked, the selected features get the label 0
+            self.label_in_area(area, 0)
+
+    def get_label_target(self):
+        # Return the selected layer and field if they can be labeled, otherwise show a warning and return (None, None)
+        selected_layer, selected_field = self.get_layer_and_field()                                  # Get layer and field
+
+        if not (selected_layer and selected_field):                                                  # Validate the layer and field names not to be None
+            self.iface.messageBar().pushMessage("No valid layer or field selected", "Please select a valid layer and field.", level=Qgis.Warning)
+            return None, None
+
+        if not is_integer_field(selected_layer.fields().field(selected_field)):                      # Check if the field is of type integer
+            self.iface.messageBar().pushMessage("Field type is not integer", f"The selected field: {selected_field} is not of type integer. Please select a field of type integer.", level=Qgis.Warning)
+            return None, None
+
+        if not selected_layer.isEditable():                                                          # Check if the layer is in editing mode
+            self.iface.messageBar().pushMessage("Editing mode is off", f"The selected layer is not in editing mode. Please enable the editing mode for the selected layer={selected_layer}.", level=Qgis.Warning)
+            return None, None
+
+        return selected_layer, selected_field
+
+    def label_at_point(self, point, label):
+        start = time.perf_counter()
+        selected_layer, selected_field = self.get_label_target()
+        if selected_layer is None:
+            return
+
+        # Find the features under the clicked point from the cached spatial index
+        with self.profiler.measure("hit_test", selected_layer):
+            feature_ids = self.hit_test(selected_layer, point)
+        log.debug("Clicked on %d features", len(feature_ids))
+
+        # Check if feature_ids is not empty, since the click might be somewhere other than a feature
+        if not feature_ids:
+            self.iface.messageBar().pushMessage("No feature found", "No feature was found at the clicked point.", level=Qgis.Warning)
+            return
+
+        self.apply_label(selected_layer, selected_field, feature_ids, label)
+
+        with self.profiler.measure("message_bar", selected_layer):
+            feature_ids = ", ".join(str(fid) for fid in feature_ids)
+            self.iface.messageBar().pushMessage("Feature updated", f"Feature with id: {feature_ids} has been updated with the value: {label} in the field: {selected_field}.", level=Qgis.Success)
+        self.profiler.record("click_total", selected_layer, time.perf_counter() - start)
+
+    def label_in_area(self, area, label):
+        selected_layer, selected_field = self.get_label_target()
+        if selected_layer is None:
+            return
+
+        # Bring the drawn area from the map coordinates to the layer coordinates
+        if selected_layer.crs() != self.map_canvas.mapSettings().destinationCrs():
+            area = QgsGeometry(area)
+            area.transform(QgsCoordinateTransform(self.map_canvas.mapSettings().destinationCrs(), selected_layer.crs(), QgsProject.instance()))
+
+        feature_ids = self.get_hit_index(selected_layer).features_in_area(area, self.area_contained_only)
+        if not feature_ids:
+            self.iface.messageBar().pushMessage("No feature found", "No feature was found in the selected area.", level=Qgis.Warning)
+            return
+
+        # The whole selection is one undo command and one provider write
+        self.apply_label(selected_layer, selected_field, feature_ids, label)
+        self.edit_buffer.flush()
+
+        self.iface.messageBar().pushMessage("Features updated", f"{len(feature_ids)} features have been updated with the value: {label} in the field: {selected_field}.", level=Qgis.Success)
+
+    def apply_label(self, layer, field_name, feature_ids, label):
+        # Push the label action on the undo stack. Pushing runs the command, which queues the values in the write-behind buffer.
+        # The action writes every field of the active session (e.g. "damaged" and "occluded") in the same batched update.
+        writes = self.session.writes(label) if self.session.layer is layer else []
+        if not writes:
+            writes = [(layer.fields().indexFromName(field_name), label)]
+        field_indexes = [field_index for field_index, _ in writes]
+        edit_buffer = self.edit_buffer_for(layer)
+
+        # The previous values are needed for undo. Values waiting in the buffer are newer than the ones in the provider.
+        with self.profiler.measure("read_old_values", layer):
+            old_values = read_attribute_maps(layer, field_indexes, feature_ids)
+            for fid in feature_ids:
+                attributes = old_values.setdefault(fid, {})
+                for field_index in field_indexes:
+                    attributes[field_index] = edit_buffer.pending_value(fid, field_index, attributes.get(field_index))
+
+        # Journal and queue the new values
+        with self.profiler.measure("journal_and_queue", layer):
+            new_values = {fid: dict(writes) for fid in feature_ids}
+            text = f"Label {len(feature_ids)} feature(s) as {label}"
+            self.undo_stack.push(LabelChangeCommand(edit_buffer, layer, new_values, old_values, text, self.journal_for(layer)))
+
+    def import_labels(self):
+        selected_layer, selected_field = self.get_label_target()
+        if selected_layer is None:
+            return
+
+        path, _ = QFileDialog.getOpenFileName(self.iface.mainWindow(), "Import labels", "", "Label records (*.csv *.geojson *.json)")
+        if not path:
+            return
+
+        # The imported values go straight to the provider, so write the buffered clicks first to keep their order
+        self.edit_buffer.flush_sync()
+        # Point records are matched in layer units, with the click tolerance as it is at the center of the canvas
+        tolerance = self.layer_tolerance(selected_layer, self.map_canvas.extent().center())
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            stats = apply_label_records(selected_layer, selected_field, read_label_records(path),
+                                        tolerance=tolerance, hit_index=self.get_hit_index(selected_layer))
+        except (LabelingError, OSError, ValueError, KeyError) as e:
+            self.iface.messageBar().pushMessage("Importing labels failed", str(e), level=Qgis.Critical)
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        selected_layer.triggerRepaint()
+        self.load_label_state(force=True)
+        self.invalidate_label_states(selected_layer)
+        self.iface.messageBar().pushMessage("Labels imported", f"{stats['written']} features have been updated in the field: {selected_field} ({stats['unmatched']} records matched no feature).", level=Qgis.Success)
+
+    def prelabel(self):
+        selected_layer, selected_field = self.get_label_target()
+        if selected_layer is None:
+            return
+
+        dialog = PrelabelDialog(selected_layer, selected_field, self.iface.mainWindow())
+        if not dialog.exec_():
+            return
+
+        # Like an import, the rule writes straight to the provider, so write the buffered clicks first to keep their order
+        self.edit_buffer.flush_sync()
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        start = time.perf_counter()
+        try:
+            stats = apply_rule(selected_layer, selected_field, dialog.expression(), dialog.label(), dialog.skip_labeled())
+        except LabelingError as e:
+            self.iface.messageBar().pushMessage("Pre-labeling failed", str(e), level=Qgis.Critical)
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.profiler.record("prelabel", selected_layer, time.perf_counter() - start)
+
+        selected_layer.triggerRepaint()
+        self.load_label_state(force=True)
+        self.invalidate_label_states(selected_layer)
+        self.iface.messageBar().pushMessage("Features pre-labeled", f"{stats['written']} features matching: {dialog.expression()} have been updated with the value: {dialog.label()} in the field: {selected_field}.", level=Qgis.Success)
+
+    def export_labels(self):
+        selected_layer, selected_field = self.get_layer_and_field()
+        if not (selected_layer and selected_field):
+            return
+        if self.export_task is not None and self.export_task.status() in (QgsTask.Queued, QgsTask.Running):
+            self.iface.messageBar().pushMessage("Export running", "The previous export is still running.", level=Qgis.Info)
+            return
+
+        directory = QFileDialog.getExistingDirectory(self.iface.mainWindow(), "Export labels to directory")
+        if not directory:
+            return
+
+        # The export reads the layer, so the buffered clicks are written first. An existing export in the directory is continued.
+        self.edit_buffer.flush_sync()
+        try:
+            exporter = LabelExporter(selected_layer, selected_field, directory, output_format=self.export_format_combo.currentData(),
+                                     val_fraction=self.export_val_spin.value() / 100.0, balance=self.export_balance_check.isChecked())
+        except LabelingError as e:
+            self.iface.messageBar().pushMessage("Exporting labels failed", str(e), level=Qgis.Critical)
+            return
+
+        def on_finished(exception, stats=None):
+            if exception is not None:
+                self.iface.messageBar().pushMessage("Exporting labels failed", str(exception), level=Qgis.Critical)
+            elif stats is not None:
+                self.iface.messageBar().pushMessage("Labels exported", f"Run {stats['run']}: {stats['train']} train and {stats['val']} val features written to: {directory} ({stats['unchanged']} unchanged, {stats['skipped']} left out by balancing, {stats['removed']} removed).", level=Qgis.Success)
+
+        self.export_task = QgsTask.fromFunction(f"Exporting labels of {selected_layer.name()}", lambda task: exporter.run(task.setProgress, task.isCanceled), on_finished=on_finished)
+        self.forget_task_when_ended("export_task", self.export_task)
+        QgsApplication.taskManager().addTask(self.export_task)
+
+    def get_hit_index(self, layer):
+        # Return the cached spatial index of the layer, building it on first use
+        hit_index = self.hit_indexes.get(layer.id())
+        if hit_index is None:
+            hit_index = LayerHitIndex(layer)
+            self.hit_indexes[layer.id()] = hit_index
+            layer.willBeDeleted.connect(lambda layer=layer: self.on_layer_will_be_deleted(layer))
+        return hit_index
+
+    def journal_for(self, layer):
+        journal = self.journals.get(layer.id())
+        if journal is None:
+            journal = LabelJournal(LabelJournal.path_for(self.journal_directory, layer))
+            self.journals[layer.id()] = journal
+        return journal
+
+    def replay_journal(self, layer):
+        # Write the journaled label changes which never reached the layer, e.g. because QGIS crashed before the buffer was flushed
+        entries = self.journal_for(layer).uncommitted()
+        if not entries:
+            return
+
+        changes = {}
+        for entry in entries:                       # Later entries win, just like they did in the buffer
+            field_index = layer.fields().indexFromName(entry["field"])
+            if field_index >= 0:
+                changes.setdefault(entry["fid"], {})[field_index] = entry["new"]
+
+        edit_buffer = self.edit_buffer_for(layer)
+        edit_buffer.add_many(changes)
+        if edit_buffer.flush_sync():
+            self.iface.messageBar().pushMessage("Labels recovered", f"{len(changes)} label changes which were not written before have been written to the layer: {layer.name()}.", level=Qgis.Info)
+
+    def on_flush_started(self, layer):
+        # Remember how far the journal went when the snapshot was taken. Changes journaled afterwards are not part of this flush.
+        journal = self.journals.get(layer.id())
+        if journal is not None:
+            self.journal_marks[layer.id()] = journal.last_seq
+
+    def on_flushed(self, layer, count):
+        # Looked up without creating: a layer which is being deleted flushes after its buffer was dropped
+        edit_buffer = self.edit_buffers.get(layer.id())
+        if edit_buffer is not None:
+            self.profiler.record("commit", layer, edit_buffer.last_write_seconds)
+
+        # Everything journaled for the layer up to the snapshot is now in the layer, so the journal can drop it
+        journal = self.journals.get(layer.id())
+        seq = self.journal_marks.pop(layer.id(), None)
+        if journal is not None and seq is not None:
+            journal.mark_committed(seq)
+            journal.compact()
+
+    def on_layer_will_be_deleted(self, layer):
+        # Write what is still pending for the layer while it is alive, and forget the state which refers to it
+        edit_buffer = self.edit_buffers.pop(layer.id(), None)
+        if edit_buffer is not None:
+            edit_buffer.flush_sync()
+            edit_buffer.layer = None
+            if self.edit_buffer is edit_buffer:
+                self.edit_buffer = self.edit_buffer_for(None)
+        for session in self.sessions.values():
+            if session.layer is layer:
+                session.label_state.load(None, -1)
+                session.set_target(None, None)
+        journal = self.journals.pop(layer.id(), None)
+        if journal is not None:
+            journal.close()
+        self.undo_stack.clear()
+        self.drop_hit_index(layer.id())
+
+    def drop_hit_index(self, layer_id):
+        hit_index = self.hit_indexes.pop(layer_id, None)
+        if hit_index is not None:
+            hit_index.disconnect_layer()
+
+    def layer_tolerance(self, layer, point):
+        # Convert the pixel tolerance around a point in map coordinates to the units of the layer
+        tolerance = self.tolerance_px * self.map_canvas.mapUnitsPerPixel()
+        search_rect = QgsRectangle(point.x() - tolerance, point.y() - tolerance, point.x() + tolerance, point.y() + tolerance)
+        layer_rect = self.map_canvas.mapSettings().mapToLayerCoordinates(layer, search_rect)
+        return max(layer_rect.width(), layer_rect.height()) / 2
+
+    def hit_test(self, layer, point):
+        # Convert the clicked point and the pixel tolerance from map coordinates to the layer coordinates
+        layer_point = self.map_canvas.mapSettings().mapToLayerCoordinates(layer, point)
+        return self.get_hit_index(layer).hit_test(layer_point, self.layer_tolerance(layer, point))
+
+    def set_tolerance_px(self, tolerance_px):
+        self.tolerance_px = tolerance_px
+
+    def on_pending_count_changed(self):
+        # Show the number of buffered label changes, and the ones being written in the background, on the toolbar
+        if not hasattr(self, "flush_action"):
+            return
+        text = f"Pending: {self.edit_buffer.pending_count()}"
+        if self.edit_buffer.is_writing():
+            text += f"  Writing: {len(self.edit_buffer.task.changes)}..."
+        self.flush_action.setText(text)
+
+    def on_render_starting(self):
+        self.render_started = time.perf_counter() if self.profiler.enabled else None
+
+    def on_canvas_refreshed(self):
+        # Time of the canvas repaint which follows a label action (or anything else which redraws the canvas)
+        if self.render_started is not None:
+            self.profiler.record("canvas_repaint", self.label_state.layer, time.perf_counter() - self.render_started)
+            self.render_started = None
+
+    def on_conflicts_detected(self, layer, fids):
+        shown = ", ".join(str(fid) for fid in fids[:20]) + (", ..." if len(fids) > 20 else "")
+        self.iface.messageBar().pushMessage("Label conflicts", f"{len(fids)} features of the layer: {layer.name()} were changed by someone else since they were labeled, and have been overwritten with the new labels (ids: {shown}).", level=Qgis.Warning)
+
+    def on_features_missing(self, layer, fids):
+        shown = ", ".join(str(fid) for fid in fids[:20]) + (", ..." if len(fids) > 20 else "")
+        self.iface.messageBar().pushMessage("Labels dropped", f"{len(fids)} labeled features no longer exist in the data source of the layer: {layer.name()}, so their labels were not written (ids: {shown}).", level=Qgis.Warning)
+
+    def on_flush_failed(self, message):
+        self.iface.messageBar().pushMessage("Writing labels failed", message, level=Qgis.Critical)
 
     def get_layer_and_field(self):
         selected_layer = None
@@ -341,11 +1158,9 @@ class BinaryLabelingPlugin:
         # Get the selected layer and the select field from the comboboxes. Also check if the selected layer and field are valid and selected.
         if self.layer_combo.currentIndex() < 0:
             self.iface.messageBar().pushMessage("No valid layer selected", "Please select a valid layer.", level=Qgis.Warning) 
-        elif (self.layer_combo.currentIndex() >= 0 and 
-              self.layer_combo.currentIndex() < len(self.vector_layers) and 
-              len(self.vector_layers) > 0):
+        elif self.selected_layer() is not None:
             
-            selected_layer = self.vector_layers[self.layer_combo.currentIndex()]  # Use stored vector_layers list
+            selected_layer = self.selected_layer()  # Look the layer up by the id stored in the combobox item
             
             # Double-check that this is indeed a vector layer
             if not (isinstance(selected_layer, QgsVectorLayer) and selected_layer.type() == QgsMapLayerType.VectorLayer):
@@ -362,18 +1177,56 @@ class BinaryLabelingPlugin:
     def check_field_type(self, selected_layer, selected_field):
         # Check if the selected field from the selected layer is from a datatype as integer.
         if selected_layer.fields().field(selected_field).type() != 10:
-            print("The selected field is not of type integer")
+            log.info("The selected field is not of type integer")
         
     def check_editing_mode(self, selected_layer):
         # Check if the Toggle Editing mode is enabled for the selected layer. Retrun a message if not.
         if not selected_layer.isEditable():
-            print("The selected layer is not in editing mode. Please enable the editing mode for the selected layer.")
+            log.info("The selected layer is not in editing mode. Please enable the editing mode for the selected layer.")
     
     def unload(self):
+        # Write the buffered label changes before the plugin goes away. The journals keep whatever could not be written.
+        for edit_buffer in self.edit_buffers.values():
+            edit_buffer.flush_sync()
+        for journal in self.journals.values():
+            journal.close()
+        self.journals = {}
+
+        self.map_canvas.renderStarting.disconnect(self.on_render_starting)
+        self.map_canvas.mapCanvasRefreshed.disconnect(self.on_canvas_refreshed)
+        self.iface.removeDockWidget(self.profiler_dock)
+        self.profiler_dock.deleteLater()
+
+        for action in list(self.label_key_actions.values()) + [self.next_session_action]:
+            self.iface.unregisterMainWindowAction(action)
+            self.iface.mainWindow().removeAction(action)
+            action.deleteLater()
+
         self.iface.mainWindow().removeToolBar(self.toolbar)
         self.toolbar.clear()
         if self.toolbar is not None:
             self.toolbar.deleteLater()
         
-        # Reset the map tool when the plugin is unloaded
+        # Stop the background prefetch and release the label state and the spatial indexes
+        for task in (self.prefetch_task, self.export_task):
+            if task is not None and task.status() in (QgsTask.Queued, QgsTask.Running):
+                task.cancel()
+        for session in self.sessions.values():
+            session.label_state.disconnect_layer()
+        for layer_id in list(self.hit_indexes):
+            self.drop_hit_index(layer_id)
+
+        # Remove the overlay
+        self.map_canvas.destinationCrsChanged.disconnect(self.reset_overlay)
+        self.reset_overlay()
+        self.label_overlay.remove()
+        self.clear_hover()
+        self.map_canvas.scene().removeItem(self.hover_band)
+
+        # Stop following the project layers
+        self.layer_model.disconnect_project()
+
+        # Reset the map tools when the plugin is unloaded
         self.map_canvas.unsetMapTool(self.tool)
+        self.map_canvas.unsetMapTool(self.area_tool)
+        self.map_canvas.unsetMapTool(self.hover_tool)
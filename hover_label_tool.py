@@ -0,0 +1,52 @@
+# Imports
+import time
+
+from qgis.PyQt.QtCore import Qt, QTimer, pyqtSignal
+from qgis.core import QgsPointXY
+from qgis.gui import QgsMapTool
+
+
+class HoverLabelTool(QgsMapTool):
+    """Map tool which reports the cursor position while the mouse moves, at most once every interval_ms.
+
+    A move inside the interval is not dropped: the last position is reported when the interval is over,
+    so the hovered feature is always the one under the cursor once the mouse stops.
+    """
+
+    HOVER = "hover"                           # Selection mode of the plugin which uses this tool
+
+    hovered = pyqtSignal(QgsPointXY)         # Emitted with the cursor position in map coordinates
+    left = pyqtSignal()                       # Emitted when the tool is deactivated
+
+    def __init__(self, canvas, interval_ms=15):
+        super().__init__(canvas)
+        self.interval_ms = interval_ms
+        self.last_emit = 0.0
+        self.last_point = None
+
+        self.trailing_timer = QTimer(self)
+        self.trailing_timer.setSingleShot(True)
+        self.trailing_timer.timeout.connect(self._emit_last_point)
+
+        self.setCursor(Qt.CrossCursor)
+
+    def _emit_last_point(self):
+        if self.last_point is None:
+            return
+        self.last_emit = time.perf_counter()
+        self.hovered.emit(self.last_point)
+
+    def canvasMoveEvent(self, event):
+        self.last_point = QgsPointXY(self.toMapCoordinates(event.pos()))
+        wait_ms = self.interval_ms - (time.perf_counter() - self.last_emit) * 1000.0
+        if wait_ms <= 0:
+            self.trailing_timer.stop()
+            self._emit_last_point()
+        elif not self.trailing_timer.isActive():
+            self.trailing_timer.start(int(wait_ms) + 1)
+
+    def deactivate(self):
+        self.trailing_timer.stop()
+        self.last_point = None
+        self.left.emit()
+        super().deactivate()
@@ -0,0 +1,223 @@
+# Imports
+import time
+
+from qgis.PyQt.QtCore import QObject, QTimer, pyqtSignal
+from qgis.core import QgsApplication
+
+from .label_commit_task import MAIN_THREAD_PROVIDERS, LabelCommitTask
+from .labeling_core import LabelingError, missing_feature_ids, write_attribute_values
+
+
+class LabelEditBuffer(QObject):
+    """Write-behind buffer for label edits.
+
+    Label changes are collected in memory as {fid: {field_index: value}} and written to the
+    layer's data provider with a single changeAttributeValues() call once the pending count
+    reaches max_pending, once the buffer has been idle for idle_ms, or when flush() is called.
+
+    With background set, flush() hands a snapshot of the pending changes to a LabelCommitTask and
+    returns right away. New changes keep collecting while the task runs, and at most one task is in
+    flight at a time so the writes reach the provider in order. flush_sync() writes on the calling thread,
+    and so does flush() for providers which a task cannot open again from the layer source (memory layers).
+    """
+
+    changesQueued = pyqtSignal(object, dict)  # Emitted with the layer and the {fid: {field_index: value}} map of every add
+    pendingCountChanged = pyqtSignal(int)     # Emitted with the number of features waiting to be written
+    flushStarted = pyqtSignal(object)         # Emitted with the layer right before a snapshot of the pending changes is taken
+    flushed = pyqtSignal(object, int)         # Emitted with the layer and the number of features written by a flush
+    flushFailed = pyqtSignal(str)             # Emitted with an error message when a flush did not succeed
+    conflictsDetected = pyqtSignal(object, list)  # Emitted with the layer and the fids which were changed by someone else meanwhile
+    featuresMissing = pyqtSignal(object, list)    # Emitted with the layer and the fids which no longer exist, whose changes were dropped
+    writingChanged = pyqtSignal(int)          # Emitted with the number of features being written in the background (0 when idle)
+
+    def __init__(self, max_pending=50, idle_ms=3000, background=True, parent=None):
+        super().__init__(parent)
+        self.layer = None
+        self.pending = {}                     # {fid: {field_index: value}}
+        self.base_values = {}                 # {fid: {field_index: value}} before the first pending change, for conflict checks
+        self.max_pending = max_pending
+        self.idle_ms = idle_ms
+        self.background = background
+        self.task = None                      # The LabelCommitTask in flight
+        self.flush_requested = False          # Flush again as soon as the task in flight is done
+        self.last_write_seconds = 0.0         # Duration of the provider write of the last successful flush
+        self.repaint_after_flush = True       # Redraw the layer after a flush. Off when the label overlay shows the changes instead.
+
+        # Single shot timer which is restarted on every edit, so it only fires after the labeler pauses.
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self.flush)
+
+    def set_layer(self, layer):
+        # Changes always belong to a single layer, so write whatever is pending before switching.
+        if layer is self.layer:
+            return
+        self.flush_sync()
+        self.layer = layer
+
+    def set_max_pending(self, max_pending):
+        self.max_pending = max(1, int(max_pending))
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+
+    def set_idle_ms(self, idle_ms):
+        self.idle_ms = max(0, int(idle_ms))
+
+    def set_background(self, background):
+        self.background = bool(background)
+
+    def set_repaint_after_flush(self, repaint):
+        self.repaint_after_flush = bool(repaint)
+
+    def pending_count(self):
+        return len(self.pending)
+
+    def is_writing(self):
+        return self.task is not None
+
+    def pending_value(self, fid, field_index, default=None):
+        """Return the value waiting to be written for the fid/field (queued, or in the task in flight), or default."""
+        attributes = self.pending.get(fid)
+        if attributes is not None and field_index in attributes:
+            return attributes[field_index]
+        if self.task is not None:
+            attributes = self.task.changes.get(fid)
+            if attributes is not None and field_index in attributes:
+                return attributes[field_index]
+        return default
+
+    def add(self, fid, field_index, value):
+        self.add_many({fid: {field_index: value}})
+
+    def add_many(self, changes, previous_values=None):
+        """Queue {fid: {field_index: value}} changes. previous_values ({fid: {field_index: value}}) are the values the labeler saw."""
+        # Merge the new changes into the pending map. A later edit of the same fid/field wins.
+        for fid, attributes in changes.items():
+            self.pending.setdefault(fid, {}).update(attributes)
+        for fid, attributes in (previous_values or {}).items():
+            base = self.base_values.setdefault(fid, {})
+            for field_index, value in attributes.items():
+                base.setdefault(field_index, value)
+        self.changesQueued.emit(self.layer, changes)
+        self.pendingCountChanged.emit(len(self.pending))
+
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+        elif self.idle_ms > 0:
+            self.idle_timer.start(self.idle_ms)
+
+    def discard(self):
+        # Drop the pending changes without writing them.
+        self.idle_timer.stop()
+        self.pending = {}
+        self.base_values = {}
+        self.pendingCountChanged.emit(0)
+
+    def _take_snapshot(self):
+        self.flushStarted.emit(self.layer)
+        changes, base_values = self.pending, self.base_values
+        self.pending, self.base_values = {}, {}
+        self.pendingCountChanged.emit(0)
+        return changes, base_values
+
+    def _restore_snapshot(self, changes, base_values):
+        # Put changes which could not be written back in front of the ones queued meanwhile, which are newer.
+        for fid, attributes in changes.items():
+            merged = dict(attributes)
+            merged.update(self.pending.get(fid, {}))
+            self.pending[fid] = merged
+        for fid, attributes in base_values.items():
+            merged = dict(attributes)
+            merged.update(self.base_values.get(fid, {}))
+            self.base_values[fid] = merged
+        self.pendingCountChanged.emit(len(self.pending))
+
+    def flush(self):
+        """Write all pending changes. Returns True when the write succeeded or was started in the background."""
+        self.idle_timer.stop()
+        if not self.pending:
+            return True
+        if self.layer is None:
+            self.flushFailed.emit("There is no layer to write the pending label changes to.")
+            return False
+        if not self.background or self.layer.providerType() in MAIN_THREAD_PROVIDERS:
+            return self.flush_sync()
+        if self.task is not None:
+            self.flush_requested = True
+            return True
+
+        changes, base_values = self._take_snapshot()
+        try:
+            self.task = LabelCommitTask(self.layer, changes, base_values)
+        except LabelingError as e:
+            self._restore_snapshot(changes, base_values)
+            self.flushFailed.emit(str(e))
+            return False
+        self.task.done.connect(lambda task=self.task: self._on_task_done(task))
+        self.writingChanged.emit(len(changes))
+        QgsApplication.taskManager().addTask(self.task)
+        return True
+
+    def _on_task_done(self, task):
+        # Called on the main thread when the task finished, or directly by flush_sync() after waiting for it
+        if task is not self.task:
+            return  # Already handled
+        self.task = None
+        self.writingChanged.emit(0)
+
+        if task.conflicts:
+            self.conflictsDetected.emit(task.layer, task.conflicts)
+        if task.missing:
+            self.featuresMissing.emit(task.layer, task.missing)
+        if task.succeeded:
+            self.last_write_seconds = task.elapsed
+            if self.repaint_after_flush:
+                task.layer.triggerRepaint()
+            self.flushed.emit(task.layer, len(task.changes) - len(task.missing))
+        else:
+            error = task.error or "the write was canceled"
+            self._restore_snapshot(task.changes, task.base_values)
+            self.flushFailed.emit(f"Writing {len(task.changes)} label changes to the layer: {task.layer.name()} failed ({error}).")
+            return
+
+        if self.flush_requested or len(self.pending) >= self.max_pending:
+            self.flush_requested = False
+            self.flush()
+
+    def flush_sync(self):
+        """Wait for the task in flight and write the pending changes on the calling thread. Returns True when nothing is left pending."""
+        self.idle_timer.stop()
+        # A finished task may start the next one (a requested flush or a full buffer), so wait until none is in flight
+        while self.task is not None:
+            task = self.task
+            self.flush_requested = False
+            task.waitForFinished(0)
+            self._on_task_done(task)
+        if not self.pending:
+            return True
+        if self.layer is None:
+            self.flushFailed.emit("There is no layer to write the pending label changes to.")
+            return False
+
+        changes, base_values = self._take_snapshot()
+        start = time.perf_counter()
+        try:
+            # Like in the task, the changes of features which no longer exist are dropped instead of failing the whole write
+            missing = missing_feature_ids(self.layer.dataProvider(), changes)
+            for fid in missing:
+                del changes[fid]
+                base_values.pop(fid, None)
+            if missing:
+                self.featuresMissing.emit(self.layer, missing)
+            if changes:
+                write_attribute_values(self.layer, changes)
+        except LabelingError as e:
+            self._restore_snapshot(changes, base_values)
+            self.flushFailed.emit(str(e))
+            return False
+        self.last_write_seconds = time.perf_counter() - start
+
+        if self.repaint_after_flush:
+            self.layer.triggerRepaint()
+        self.flushed.emit(self.layer, len(changes))
+        return True
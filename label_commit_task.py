@@ -0,0 +1,102 @@
+# Imports
+import time
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsDataProvider, QgsFeatureRequest, QgsProviderRegistry, QgsTask, QgsVectorDataProvider
+
+from .labeling_core import missing_feature_ids, to_provider_changes
+
+# Providers whose source string does not open the same data again: a memory layer source builds a new, empty provider.
+# Their changes are written on the main thread through the layer's own provider instead.
+MAIN_THREAD_PROVIDERS = ("memory",)
+
+
+def _same_value(a, b):
+    # NULL comes back from the provider as a NULL QVariant and is buffered as None. Treat every non-plain value as NULL.
+    def plain(value):
+        return value if isinstance(value, (int, float, str)) else None
+    return plain(a) == plain(b)
+
+
+class LabelCommitTask(QgsTask):
+    """Background task which writes one snapshot of buffered label changes.
+
+    The task opens its own data provider on the layer source, so the provider I/O (e.g. a PostGIS round-trip or
+    a GeoPackage on a network share) never runs on the main thread and never touches the provider of the layer
+    which is being rendered. Before writing, it reads the current values of the changed features and reports
+    the ones which differ from the values the labeler started from, i.e. features somebody else changed meanwhile.
+    Those are still overwritten, since the label is the newer decision. Changes of features which do not exist in
+    the opened provider (deleted by someone else meanwhile) are dropped and reported in missing, and the rest is written.
+    """
+
+    done = pyqtSignal()                       # Emitted on the main thread once the task finished, whatever the outcome
+
+    def __init__(self, layer, changes, base_values):
+        super().__init__(f"Writing {len(changes)} labels to {layer.name()}", QgsTask.CanCancel)
+        self.layer = layer
+        self.source = layer.source()
+        self.provider_type = layer.providerType()
+        self.changes = changes                # {fid: {field_index: value}}
+        self.base_values = base_values        # {fid: {field_index: value}} as they were before the first buffered change
+
+        # The task talks to the provider directly, so it works with provider field indexes. Translate them while the layer is at hand.
+        self.provider_changes = to_provider_changes(layer, changes)
+        self.provider_base_values = to_provider_changes(layer, base_values)
+        self.conflicts = []                   # fids whose stored value changed since the labeler saw it
+        self.missing = []                     # fids which do not exist in the data source, whose changes were dropped
+        self.error = None
+        self.succeeded = False
+        self.elapsed = 0.0                    # Seconds spent in run(), for the profiler
+
+    def _read_current_values(self, provider):
+        field_indexes = sorted({field_index for attributes in self.provider_base_values.values() for field_index in attributes})
+        if not field_indexes:
+            return {}
+        request = QgsFeatureRequest().setFilterFids(list(self.provider_base_values))
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(field_indexes)
+        return {feature.id(): feature.attributes() for feature in provider.getFeatures(request)}
+
+    def run(self):
+        start = time.perf_counter()
+        self.succeeded = self._write()
+        self.elapsed = time.perf_counter() - start
+        return self.succeeded
+
+    def finished(self, result):
+        self.done.emit()
+
+    def _write(self):
+        provider = QgsProviderRegistry.instance().createProvider(self.provider_type, self.source, QgsDataProvider.ProviderOptions())
+        if provider is None or not provider.isValid():
+            self.error = f"The layer source could not be opened with the provider: {self.provider_type}."
+            return False
+        if not provider.capabilities() & QgsVectorDataProvider.ChangeAttributeValues:
+            self.error = f"The data provider: {self.provider_type} does not support changing attribute values."
+            return False
+
+        # A missing feature would fail the whole write and keep the batch pending forever, so only its changes are dropped
+        self.missing = missing_feature_ids(provider, self.provider_changes)
+        for fid in self.missing:
+            del self.provider_changes[fid]
+            self.provider_base_values.pop(fid, None)
+        if not self.provider_changes:
+            return True
+
+        current = self._read_current_values(provider)
+        for fid, attributes in self.provider_base_values.items():
+            stored = current.get(fid)
+            if stored is None:
+                continue
+            for field_index, base_value in attributes.items():
+                new_value = self.provider_changes.get(fid, {}).get(field_index)
+                if not _same_value(stored[field_index], base_value) and not _same_value(stored[field_index], new_value):
+                    self.conflicts.append(fid)
+                    break
+
+        if self.isCanceled():
+            return False
+        if not provider.changeAttributeValues(self.provider_changes):
+            self.error = "; ".join(provider.errors()) or "unknown provider error"
+            return False
+        return True
@@ -0,0 +1,409 @@
+"""Streaming export of the labeled features of a layer to a training dataset.
+
+Only features whose label field holds 0 or 1 are read, with the filter sent to the data provider, and they are
+written in chunks to shards of GeoParquet (with pyarrow) or CSV with hex WKB geometries:
+
+    <directory>/manifest.json                    parameters, runs, shards and split counts
+    <directory>/train/part-<run>-<shard>.parquet
+    <directory>/val/part-<run>-<shard>.parquet
+    <directory>/removed-<run>.csv                fids exported earlier which are no longer labeled
+
+Every run only exports the features which are new or whose label changed since the previous runs, so a feature
+may appear in several runs: the row of the latest run wins, and the removed files list the fids to drop. A run
+which was interrupted is resumed by the next one. Features keep the split they were first given.
+"""
+
+# Imports
+import csv
+import json
+import os
+import time
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+
+from qgis.core import QgsExpression, QgsFeatureRequest, QgsVectorLayerFeatureSource
+
+from .labeling_core import LabelingError, resolve_field_index
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("parquet", "csv")
+SPLITS = ("train", "val")
+TRAIN, VAL, SKIPPED, REMOVED = 0, 1, 2, 3     # Split codes kept in the export state. SKIPPED: left out by class balancing.
+MANIFEST_FILE = "manifest.json"
+STATE_FILE = "export_state.bin"
+LOG_FILE = "export_state.log"
+
+
+def _unit_hash(fid, seed):
+    # Stable pseudo random number in [0, 1) for a feature, the same in every run
+    digest = blake2b(f"{seed}:{fid}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2.0 ** 64
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _projjson(crs):
+    # GeoParquet wants the CRS as PROJJSON. pyproj is optional too; without it the CRS is left undefined (the manifest has the WKT).
+    try:
+        from pyproj import CRS
+    except ImportError:
+        return None
+    return CRS.from_wkt(crs.toWkt()).to_json_dict() if crs.isValid() else None
+
+
+class ExportState:
+    """fid -> (label, split) of everything the previous runs exported, used to find what changed since.
+
+    A sorted array('q') of fids with a parallel array('b') of codes (label * 4 + split) is kept on disk and
+    loaded once per run. The decisions of the run in progress are appended to a log after each shard is
+    closed, and merged into the arrays when the run finishes (or when the next run starts after a crash).
+    """
+
+    def __init__(self, directory):
+        self.snapshot_path = os.path.join(directory, STATE_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.fids = array("q")
+        self.codes = array("b")
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                count = array("q")
+                count.fromfile(f, 1)
+                self.fids.fromfile(f, count[0])
+                self.codes.fromfile(f, count[0])
+
+        # Merge what an interrupted run logged, so it is not exported twice
+        if os.path.exists(self.log_path):
+            new_fids, new_codes = array("q"), array("b")
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    fid, code = line.split()
+                    new_fids.append(int(fid))
+                    new_codes.append(int(code))
+            self._merge(new_fids, new_codes)
+            self.save()
+
+        self.seen = bytearray(len(self.fids))
+        self.new_fids = array("q")
+        self.new_codes = array("b")
+        self.log = open(self.log_path, "a", encoding="utf-8")
+
+    def lookup(self, fid):
+        """Return the code the feature was exported with (or None), and remember that it is still labeled."""
+        i = bisect_left(self.fids, fid)
+        if i < len(self.fids) and self.fids[i] == fid:
+            self.seen[i] = 1
+            return self.codes[i]
+        return None
+
+    def unseen(self):
+        # [(fid, code)] of the features exported before which were not met in this run: they are no longer labeled, or deleted
+        return [(self.fids[i], self.codes[i]) for i in range(len(self.fids)) if not self.seen[i]]
+
+    def append(self, entries):
+        """Log [(fid, code)] decisions. Call it only once the rows of these features are in a closed shard."""
+        for fid, code in entries:
+            self.log.write(f"{fid} {code}\n")
+            self.new_fids.append(fid)
+            self.new_codes.append(code)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+    def _merge(self, new_fids, new_codes):
+        # Merge the new entries into the sorted arrays. A later entry of a fid wins, and a REMOVED entry drops the feature.
+        order = list(range(len(new_fids)))
+        if any(new_fids[i] > new_fids[i + 1] for i in range(len(new_fids) - 1)):
+            order.sort(key=new_fids.__getitem__)        # Stable, so the later entries of a fid stay last
+        fids, codes = array("q"), array("b")
+        i, k = 0, 0
+        while k < len(order):
+            fid = new_fids[order[k]]
+            while k + 1 < len(order) and new_fids[order[k + 1]] == fid:
+                k += 1
+            code = new_codes[order[k]]
+            k += 1
+            while i < len(self.fids) and self.fids[i] < fid:
+                fids.append(self.fids[i])
+                codes.append(self.codes[i])
+                i += 1
+            if i < len(self.fids) and self.fids[i] == fid:
+                i += 1
+            if code % 4 != REMOVED:
+                fids.append(fid)
+                codes.append(code)
+        fids.extend(self.fids[i:])
+        codes.extend(self.codes[i:])
+        self.fids, self.codes = fids, codes
+
+    def save(self):
+        with open(self.snapshot_path + ".tmp", "wb") as f:
+            array("q", [len(self.fids)]).tofile(f)
+            self.fids.tofile(f)
+            self.codes.tofile(f)
+        os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def finish(self):
+        """Merge the decisions of this run into the snapshot and start a new log."""
+        self.log.close()
+        self._merge(self.new_fids, self.new_codes)
+        self.save()
+        self.new_fids, self.new_codes = array("q"), array("b")
+
+    def close(self):
+        if not self.log.closed:
+            self.log.close()
+
+
+class _CsvShard:
+    extension = "csv"
+
+    def __init__(self, path, crs):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["fid", "label", "geometry_wkb"])
+
+    def write(self, rows):
+        self.writer.writerows((fid, label, wkb.hex() if wkb is not None else "") for fid, label, wkb in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetShard:
+    extension = "parquet"
+
+    def __init__(self, path, crs):
+        geo = {"version": "1.0.0", "primary_column": "geometry",
+               "columns": {"geometry": {"encoding": "WKB", "geometry_types": [], "crs": _projjson(crs)}}}
+        self.schema = pyarrow.schema([("fid", pyarrow.int64()), ("label", pyarrow.int8()), ("geometry", pyarrow.binary())],
+                                     metadata={b"geo": json.dumps(geo).encode()})
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        # Every chunk becomes one row group, so only one chunk is ever held in memory
+        fids, labels, wkbs = zip(*rows)
+        self.writer.write_table(pyarrow.table([list(fids), list(labels), list(wkbs)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class LabelExporter:
+    """Exports the features labeled 0 or 1 in one field of a layer to a directory of shards.
+
+    Everything which needs the layer is done in the constructor, so run() can be called from a background task.
+    val_fraction of each class goes to the val split (a stratified split, counted per class over all runs).
+    With balance, features of the larger class are left out of the train split at random, so both classes have
+    about as many train features as the smaller class has labeled features.
+    """
+
+    def __init__(self, layer, field_name, directory, output_format="parquet", shard_size=500000, chunk_size=10000,
+                 val_fraction=0.0, balance=False, seed=0, full=False):
+        if output_format not in FORMATS:
+            raise LabelingError(f"The export format: {output_format} is not one of: {', '.join(FORMATS)}.")
+        if output_format == "parquet" and pyarrow is None:
+            raise LabelingError("Exporting GeoParquet needs the pyarrow package. Install it, or export to CSV.")
+        if not 0.0 <= val_fraction < 1.0:
+            raise LabelingError(f"The validation fraction: {val_fraction} is not between 0 and 1.")
+
+        self.field_index = resolve_field_index(layer, field_name)
+        self.field_name = field_name
+        self.directory = directory
+        self.shard_class = _ParquetShard if output_format == "parquet" else _CsvShard
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+        self.val_fraction = val_fraction
+        self.balance = balance
+        self.seed = seed
+        self.full = full                      # Export every labeled feature again, not only the changed ones
+        self.crs = layer.crs()
+        self.source = QgsVectorLayerFeatureSource(layer)
+
+        self.parameters = {"layer": layer.source(), "provider": layer.providerType(), "field": field_name, "format": output_format,
+                           "val_fraction": val_fraction, "balance": balance, "seed": seed,
+                           "crs": self.crs.authid(), "crs_wkt": self.crs.toWkt()}
+
+    def _labeled_request(self, labels="(0, 1)"):
+        # Plain SQL terms, so providers which compile expressions only return the labeled features
+        column = QgsExpression.quotedColumnRef(self.field_name)
+        return QgsFeatureRequest().setFilterExpression(f"{column} IN {labels}")
+
+    def _count(self, label):
+        request = self._labeled_request(f"({label})").setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+        return sum(1 for _ in self.source.getFeatures(request))
+
+    def _load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return dict(self.parameters, runs=[], split_counts={"0": [0, 0], "1": [0, 0]})
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        for key in ("field", "format", "val_fraction", "balance", "seed"):
+            if manifest.get(key) != self.parameters[key]:
+                raise LabelingError(f"The directory: {self.directory} holds an export with a different {key} ({manifest.get(key)}). Export to a new directory instead.")
+        return manifest
+
+    def run(self, progress=None, is_canceled=None):
+        """Export the new and changed labels. Returns a dict with the run number and the counts of exported, skipped, unchanged and removed features."""
+        is_canceled = is_canceled or (lambda: False)
+        for split in SPLITS:
+            os.makedirs(os.path.join(self.directory, split), exist_ok=True)
+            for name in os.listdir(os.path.join(self.directory, split)):
+                if name.endswith(".tmp"):     # A shard an interrupted run did not finish. Its features were never logged.
+                    os.remove(os.path.join(self.directory, split, name))
+
+        manifest = self._load_manifest()
+        manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        if manifest["runs"] and manifest["runs"][-1]["finished"] is None:
+            run = manifest["runs"][-1]            # Resume the interrupted run
+        else:
+            run = {"run": len(manifest["runs"]) + 1, "started": time.time(), "finished": None, "shards": [], "removed": None}
+            manifest["runs"].append(run)
+        _write_json(manifest_path, manifest)
+
+        counts = {0: self._count(0), 1: self._count(1)}
+        keep = {label: 1.0 for label in counts}
+        if self.balance and min(counts.values()) > 0:
+            keep = {label: min(counts.values()) / count for label, count in counts.items()}
+        total = counts[0] + counts[1]
+
+        state = ExportState(self.directory)
+        # {label: [seen, val]} over all runs. The assignment uses split_counts, which includes the features decided in this run.
+        # The manifest only gets logged_counts, which include a feature once its decision is logged: a resumed run decides the others again.
+        split_counts = manifest["split_counts"]
+        logged_counts = {label: list(class_counts) for label, class_counts in split_counts.items()}
+        stats = {"run": run["run"], "train": 0, "val": 0, "skipped": 0, "unchanged": 0, "removed": 0}
+        shards = {}                               # {split: [shard writer, path, rows written, [(fid, code)] to log on close, {label: new features}]}
+        buffers = {TRAIN: [], VAL: []}            # Rows waiting to be written, at most chunk_size per split
+        buffered_new = {TRAIN: {0: 0, 1: 0}, VAL: {0: 0, 1: 0}}     # Features in the buffers which split_counts counted
+        shard_number = len(run["shards"])
+
+        def log_entries(entries, split, new_features):
+            state.append(entries)
+            for label, count in new_features.items():
+                logged_counts[str(label)][0] += count
+                if split == VAL:
+                    logged_counts[str(label)][1] += count
+            manifest["split_counts"] = logged_counts
+            _write_json(manifest_path, manifest)
+
+        def close_shard(split):
+            writer, path, _, entries, new_features = shards.pop(split)
+            writer.close()
+            final_path = path[:-len(".tmp")]
+            os.replace(path, final_path)
+            run["shards"].append(os.path.relpath(final_path, self.directory))
+            log_entries(entries, split, new_features)
+
+        def write_rows(split):
+            nonlocal shard_number
+            rows = buffers[split]
+            if not rows:
+                return
+            if split not in shards:
+                shard_number += 1
+                path = os.path.join(self.directory, SPLITS[split], f"part-{run['run']:05d}-{shard_number:05d}.{self.shard_class.extension}.tmp")
+                shards[split] = [self.shard_class(path, self.crs), path, 0, [], {0: 0, 1: 0}]
+            shard = shards[split]
+            shard[0].write(rows)
+            shard[2] += len(rows)
+            shard[3].extend((fid, label * 4 + split) for fid, label, _ in rows)
+            for label, count in buffered_new[split].items():
+                shard[4][label] += count
+            buffers[split] = []
+            buffered_new[split] = {0: 0, 1: 0}
+            if shard[2] >= self.shard_size:
+                close_shard(split)
+
+        def assign_split(fid, label, previous):
+            # Features keep the split they were first given. New ones are assigned per class, so val_fraction holds for both.
+            if previous is not None and previous % 4 in (TRAIN, VAL):
+                return previous % 4
+            if previous is None:
+                class_counts = split_counts[str(label)]
+                class_counts[0] += 1
+                if class_counts[1] < round(self.val_fraction * class_counts[0]):
+                    class_counts[1] += 1
+                    return VAL
+            return TRAIN if _unit_hash(fid, self.seed) < keep[label] else SKIPPED
+
+        def log_skipped():
+            # Skipped features are in no shard, so their decisions are logged in chunks right away
+            nonlocal skipped_entries, skipped_new
+            if skipped_entries:
+                log_entries(skipped_entries, SKIPPED, skipped_new)
+            skipped_entries, skipped_new = [], {0: 0, 1: 0}
+
+        request = self._labeled_request().setSubsetOfAttributes([self.field_index])
+        skipped_entries = []
+        skipped_new = {0: 0, 1: 0}                # Skipped features which split_counts counted
+        processed = 0
+        try:
+            for feature in self.source.getFeatures(request):
+                fid = feature.id()
+                label = feature.attribute(self.field_index)
+                previous = state.lookup(fid)
+                processed += 1
+                if progress is not None and processed % self.chunk_size == 0 and total:
+                    progress(100.0 * processed / total)
+                if is_canceled():
+                    return None
+
+                if previous is not None and previous // 4 == label and not self.full:
+                    stats["unchanged"] += 1
+                    continue
+
+                split = assign_split(fid, label, previous)
+                if split == SKIPPED:
+                    stats["skipped"] += 1
+                    skipped_entries.append((fid, label * 4 + SKIPPED))
+                    skipped_new[label] += previous is None
+                    if len(skipped_entries) >= self.chunk_size:
+                        log_skipped()
+                    continue
+                geometry = feature.geometry()
+                buffers[split].append((fid, label, bytes(geometry.asWkb()) if not geometry.isNull() else None))
+                buffered_new[split][label] += previous is None
+                stats[SPLITS[split]] += 1
+                if len(buffers[split]) >= self.chunk_size:
+                    write_rows(split)
+
+            for split in (TRAIN, VAL):
+                write_rows(split)
+                if split in shards:
+                    close_shard(split)
+            log_skipped()
+
+            # Features exported before which are no longer labeled
+            unseen = state.unseen()
+            removed = [fid for fid, code in unseen if code % 4 in (TRAIN, VAL)]     # Skipped features were never in a shard
+            if removed:
+                run["removed"] = f"removed-{run['run']:05d}.csv"
+                with open(os.path.join(self.directory, run["removed"]), "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["fid"])
+                    writer.writerows([fid] for fid in removed)
+            state.append((fid, REMOVED) for fid, _ in unseen)
+            stats["removed"] = len(removed)
+
+            state.finish()
+            run["finished"] = time.time()
+            run["stats"] = stats
+            manifest["split_counts"] = logged_counts
+            _write_json(manifest_path, manifest)
+        finally:
+            for shard in shards.values():         # Left over after a cancel or an error. The next run removes them.
+                shard[0].close()
+            state.close()
+        return stats
@@ -0,0 +1,37 @@
+# Imports
+from qgis.PyQt.QtWidgets import QUndoCommand
+
+
+class LabelChangeCommand(QUndoCommand):
+    """Undo command for one label action (a click or an area selection), however many features it touched.
+
+    Both directions go through the write-behind buffer, so undoing or redoing a 50k feature selection
+    is a single bulk provider write as well. Both directions are also appended to the label journal
+    (when there is one) before they are buffered, so they survive a crash until they are written.
+    """
+
+    def __init__(self, edit_buffer, layer, new_values, old_values, text, journal=None):
+        super().__init__(text)
+        self.edit_buffer = edit_buffer
+        self.layer = layer
+        self.new_values = new_values          # {fid: {field_index: value}}, one or more fields per feature
+        self.old_values = old_values          # {fid: {field_index: value}}
+        self.journal = journal
+
+    def _apply(self, values, previous_values):
+        if self.journal is not None:
+            # The journal keeps one batch per field
+            by_field = {}
+            for fid, attributes in values.items():
+                for field_index, value in attributes.items():
+                    by_field.setdefault(field_index, {})[fid] = (previous_values.get(fid, {}).get(field_index), value)
+            for field_index, changes in by_field.items():
+                self.journal.append(self.layer.fields().at(field_index).name(), changes)
+        self.edit_buffer.set_layer(self.layer)
+        self.edit_buffer.add_many(values, {fid: previous_values.get(fid, {}) for fid in values})
+
+    def redo(self):
+        self._apply(self.new_values, self.old_values)
+
+    def undo(self):
+        self._apply(self.old_values, self.new_values)
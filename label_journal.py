@@ -0,0 +1,102 @@
+# Imports
+import hashlib
+import json
+import os
+import time
+
+
+def _plain(value):
+    # Attribute values are journaled as JSON. NULL (and anything else which is not a plain number or string) becomes None.
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+class LabelJournal:
+    """Append-only on-disk journal of the label changes of one layer.
+
+    Every label change is one JSON line {"seq", "batch", "fid", "field", "old", "new", "ts"} which is
+    appended and flushed to the OS right away, so a crash of QGIS loses nothing. Once the changes are
+    written to the layer, a {"commit": seq} line marks them as committed and compact() drops them.
+    Entries after the last commit marker are replayed the next time the layer is labeled.
+    """
+
+    def __init__(self, path, sync=False):
+        self.path = path
+        self.sync = sync          # Also fsync every append, which survives an OS crash too but costs a disk flush per label action
+        self.last_seq = 0
+        self.last_batch = 0
+        self.committed_seq = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for entry in self._read():
+            if "commit" in entry:
+                self.committed_seq = max(self.committed_seq, entry["commit"])
+            else:
+                self.last_seq = max(self.last_seq, entry["seq"])
+                self.last_batch = max(self.last_batch, entry["batch"])
+        self.file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def path_for(directory, layer):
+        # One journal file per layer source, so the same data is recognized again after QGIS restarts
+        key = hashlib.sha1(f"{layer.providerType()}:{layer.source()}".encode("utf-8")).hexdigest()
+        return os.path.join(directory, f"{key}.jsonl")
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break  # A torn last line from a crash during the append; everything before it is intact
+        return entries
+
+    def _write_lines(self, lines):
+        self.file.write("".join(lines))
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def append(self, field_name, changes):
+        """Append one batch of {fid: (old, new)} changes of one field. Returns the sequence number of its last entry."""
+        self.last_batch += 1
+        timestamp = time.time()
+        lines = []
+        for fid, (old, new) in changes.items():
+            self.last_seq += 1
+            entry = {"seq": self.last_seq, "batch": self.last_batch, "fid": fid, "field": field_name,
+                     "old": _plain(old), "new": _plain(new), "ts": timestamp}
+            lines.append(json.dumps(entry) + "\n")
+        self._write_lines(lines)
+        return self.last_seq
+
+    def mark_committed(self, seq=None):
+        """Record that every entry up to seq (default: all of them) has been written to the layer."""
+        seq = self.last_seq if seq is None else seq
+        if seq <= self.committed_seq:
+            return
+        self.committed_seq = seq
+        self._write_lines([json.dumps({"commit": seq}) + "\n"])
+
+    def uncommitted(self):
+        """Return the entries which were never marked as committed, in the order they were made."""
+        return [entry for entry in self._read() if "commit" not in entry and entry["seq"] > self.committed_seq]
+
+    def compact(self):
+        # Rewrite the journal with only the uncommitted entries. The new file replaces the old one atomically.
+        entries = self.uncommitted()
+        self.file.close()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,119 @@
+# Imports
+from qgis.PyQt.QtCore import QRectF
+from qgis.PyQt.QtGui import QBrush, QColor, QPainter, QPainterPath, QPen, QPolygonF
+from qgis.PyQt.QtWidgets import QGraphicsItem
+from qgis.core import QgsFeature, QgsPointXY, QgsRectangle, QgsSpatialIndex, QgsWkbTypes
+from qgis.gui import QgsMapCanvasItem
+
+from .label_state import UNLABELED
+
+
+class LabelOverlay(QgsMapCanvasItem):
+    """Canvas item which colors the features labeled in this session by their label.
+
+    It gives immediate feedback without redrawing the layer: a label change only invalidates the screen
+    rectangle of the changed feature, and paint() only draws the features inside the exposed rectangle,
+    found through a spatial index of the overlay's own geometries. Geometries are kept in map coordinates.
+    """
+
+    COLORS = {1: QColor(0, 170, 0), 0: QColor(220, 30, 30)}
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.features = {}                    # {fid: (geometry in map coordinates, state)}
+        self.index = QgsSpatialIndex()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)   # Gives paint() the exposed rectangle
+        self.setZValue(100)
+
+        self.canvas.extentsChanged.connect(self.on_extents_changed)
+        self.on_extents_changed()
+
+    def on_extents_changed(self):
+        # The item always covers the whole canvas. Panning or zooming redraws the canvas anyway.
+        self.setRect(self.canvas.extent())
+
+    def _index_feature(self, fid, geometry, add):
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometry)
+        if add:
+            self.index.addFeature(feature)
+        else:
+            self.index.deleteFeature(feature)
+
+    def _screen_rect(self, map_rect):
+        # Screen rectangle of a map rectangle in item coordinates, grown by the outline width and the point marker radius
+        top_left = self.toCanvasCoordinates(QgsPointXY(map_rect.xMinimum(), map_rect.yMaximum())) - self.pos()
+        bottom_right = self.toCanvasCoordinates(QgsPointXY(map_rect.xMaximum(), map_rect.yMinimum())) - self.pos()
+        return QRectF(top_left, bottom_right).normalized().adjusted(-8, -8, 8, 8)
+
+    def set_state(self, fid, geometry, state):
+        """Show the feature with the given label state. UNLABELED removes it from the overlay."""
+        old = self.features.pop(fid, None)
+        if old is not None:
+            self._index_feature(fid, old[0], False)
+            self.update(self._screen_rect(old[0].boundingBox()))
+
+        if state == UNLABELED or geometry is None or geometry.isNull():
+            return
+        self.features[fid] = (geometry, state)
+        self._index_feature(fid, geometry, True)
+        self.update(self._screen_rect(geometry.boundingBox()))
+
+    def clear(self):
+        self.features = {}
+        self.index = QgsSpatialIndex()
+        self.update()
+
+    def _to_polygon(self, points):
+        return QPolygonF([self.toCanvasCoordinates(point) - self.pos() for point in points])
+
+    def _path(self, geometry):
+        # Painter path of a (multi) polygon or (multi) line in item coordinates
+        path = QPainterPath()
+        if geometry.type() == QgsWkbTypes.PolygonGeometry:
+            polygons = geometry.asMultiPolygon() if geometry.isMultipart() else [geometry.asPolygon()]
+            for polygon in polygons:
+                for ring in polygon:
+                    path.addPolygon(self._to_polygon(ring))
+                    path.closeSubpath()
+        else:
+            lines = geometry.asMultiPolyline() if geometry.isMultipart() else [geometry.asPolyline()]
+            for line in lines:
+                path.addPolygon(self._to_polygon(line))
+        return path
+
+    def paint(self, painter, option=None, widget=None):
+        if not self.features:
+            return
+
+        # Only draw the features inside the exposed part of the canvas
+        if option is not None and not option.exposedRect.isEmpty():
+            exposed = option.exposedRect.translated(self.pos())
+            to_map = self.canvas.getCoordinateTransform()
+            corner1 = to_map.toMapCoordinates(int(exposed.left()), int(exposed.top()))
+            corner2 = to_map.toMapCoordinates(int(exposed.right()) + 1, int(exposed.bottom()) + 1)
+            fids = self.index.intersects(QgsRectangle(corner1, corner2))
+        else:
+            fids = list(self.features)
+
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        for fid in fids:
+            geometry, state = self.features[fid]
+            color = self.COLORS[state]
+            fill = QColor(color)
+            fill.setAlpha(90)
+            painter.setPen(QPen(color, 2))
+
+            if geometry.type() == QgsWkbTypes.PointGeometry:
+                painter.setBrush(QBrush(fill))
+                points = geometry.asMultiPoint() if geometry.isMultipart() else [geometry.asPoint()]
+                for point in points:
+                    painter.drawEllipse(self.toCanvasCoordinates(point) - self.pos(), 6, 6)
+            else:
+                painter.setBrush(QBrush(fill) if geometry.type() == QgsWkbTypes.PolygonGeometry else QBrush())
+                painter.drawPath(self._path(geometry))
+
+    def remove(self):
+        self.canvas.extentsChanged.disconnect(self.on_extents_changed)
+        self.canvas.scene().removeItem(self)
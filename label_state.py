@@ -0,0 +1,220 @@
+# Imports
+from array import array
+from bisect import bisect_left
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsFeatureRequest
+
+UNLABELED = -1
+
+
+def state_of(value):
+    # Map an attribute value to a label state. Anything which is not 0 or 1 (NULL included) counts as unlabeled.
+    if isinstance(value, int) and not isinstance(value, bool) and value in (0, 1):
+        return value
+    return UNLABELED
+
+
+def hilbert_index(order, x, y):
+    """Position of the cell (x, y) along a Hilbert curve over a 2**order x 2**order grid."""
+    n = 1 << order
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+
+class LabelStateCache(QObject):
+    """Compact fid -> label state map for one field of one layer.
+
+    The fids are kept sorted in an array('q') with the states (UNLABELED, 0 or 1) in a parallel array('b'),
+    so a multi-million feature layer needs a few bytes per feature. It is loaded with one attribute-only
+    pass and then kept current from the label changes of the plugin and the layer's own signals.
+    """
+
+    countsChanged = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.layer = None
+        self.field_index = -1
+        self.clear()
+
+    def clear(self):
+        self.fids = array("q")
+        self.states = array("b")
+        self.counts = {UNLABELED: 0, 0: 0, 1: 0}
+        self.hilbert_order = None             # array('q') of fids in Hilbert order of their centroids, built on demand
+        self.cursor = 0                       # Position of the next unlabeled search in hilbert_order
+        self.temporary_fids = set()           # Negative ids of the features added in edit mode, which are replaced on commit
+
+    def load(self, layer, field_index):
+        """Read the state of every feature of the layer with a single attribute-only request."""
+        self.disconnect_layer()
+        self.clear()
+        self.layer = layer
+        self.field_index = field_index
+        if layer is None or field_index < 0:
+            self.countsChanged.emit()
+            return
+
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([field_index])
+        pairs = [(feature.id(), state_of(feature.attribute(field_index))) for feature in layer.getFeatures(request)]
+        if any(pairs[i][0] > pairs[i + 1][0] for i in range(len(pairs) - 1)):
+            pairs.sort()
+
+        self.fids = array("q", (fid for fid, _ in pairs))
+        self.states = array("b", (state for _, state in pairs))
+        for state in self.states:
+            self.counts[state] += 1
+
+        layer.attributeValueChanged.connect(self.on_attribute_value_changed)
+        layer.featureAdded.connect(self.on_feature_added)
+        layer.featureDeleted.connect(self.on_feature_deleted)
+        layer.committedFeaturesAdded.connect(self.on_committed_features_added)
+        self.countsChanged.emit()
+
+    def disconnect_layer(self):
+        if self.layer is None:
+            return
+        try:
+            self.layer.attributeValueChanged.disconnect(self.on_attribute_value_changed)
+            self.layer.featureAdded.disconnect(self.on_feature_added)
+            self.layer.featureDeleted.disconnect(self.on_feature_deleted)
+            self.layer.committedFeaturesAdded.disconnect(self.on_committed_features_added)
+        except (TypeError, RuntimeError):
+            pass  # The layer might already be deleted
+        self.layer = None
+
+    def _position(self, fid):
+        position = bisect_left(self.fids, fid)
+        if position < len(self.fids) and self.fids[position] == fid:
+            return position
+        return -1
+
+    def state(self, fid):
+        position = self._position(fid)
+        return self.states[position] if position >= 0 else UNLABELED
+
+    def total(self):
+        return len(self.fids)
+
+    def update_values(self, values):
+        """Apply {fid: value} label changes to the cache."""
+        changed = False
+        for fid, value in values.items():
+            position = self._position(fid)
+            if position < 0:
+                continue
+            state = state_of(value)
+            if self.states[position] != state:
+                self.counts[self.states[position]] -= 1
+                self.counts[state] += 1
+                self.states[position] = state
+                changed = True
+        if changed:
+            self.countsChanged.emit()
+
+    def on_changes_queued(self, layer, changes):
+        # Slot for the write-behind buffer, which reports every queued {fid: {field_index: value}} map
+        if layer is self.layer:
+            self.update_values({fid: attributes[self.field_index] for fid, attributes in changes.items() if self.field_index in attributes})
+
+    def on_attribute_value_changed(self, fid, field_index, value):
+        if field_index == self.field_index:
+            self.update_values({fid: value})
+
+    def on_feature_added(self, fid):
+        if self._position(fid) >= 0:
+            return
+        state = state_of(self.layer.getFeature(fid).attribute(self.field_index))
+        position = bisect_left(self.fids, fid)
+        self.fids.insert(position, fid)
+        self.states.insert(position, state)
+        self.counts[state] += 1
+        if fid < 0:
+            self.temporary_fids.add(fid)
+        self.hilbert_order = None
+        self.countsChanged.emit()
+
+    def _drop(self, fid):
+        position = self._position(fid)
+        if position < 0:
+            return False
+        self.counts[self.states[position]] -= 1
+        del self.fids[position]
+        del self.states[position]
+        return True
+
+    def on_feature_deleted(self, fid):
+        self.temporary_fids.discard(fid)
+        if self._drop(fid):
+            self.hilbert_order = None
+            self.countsChanged.emit()
+
+    def on_committed_features_added(self, layer_id, features):
+        # The committed features get the ids the provider gave them, so their temporary ids are replaced in one pass
+        for fid in self.temporary_fids:
+            self._drop(fid)
+        self.temporary_fids = set()
+
+        request = QgsFeatureRequest().setFilterFids([feature.id() for feature in features])
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([self.field_index])
+        for feature in self.layer.getFeatures(request):
+            if self._position(feature.id()) >= 0:
+                continue
+            state = state_of(feature.attribute(self.field_index))
+            position = bisect_left(self.fids, feature.id())
+            self.fids.insert(position, feature.id())
+            self.states.insert(position, state)
+            self.counts[state] += 1
+        self.hilbert_order = None
+        self.countsChanged.emit()
+
+    def build_hilbert_order(self, geometry_of, extent, order=16):
+        """Sort the fids along a Hilbert curve through their bounding box centers, so consecutive features are close together."""
+        cells = (1 << order) - 1
+        width = extent.width() or 1.0
+        height = extent.height() or 1.0
+
+        keyed = []
+        for fid in self.fids:
+            center = geometry_of(fid).boundingBox().center()
+            x = int((center.x() - extent.xMinimum()) / width * cells)
+            y = int((center.y() - extent.yMinimum()) / height * cells)
+            keyed.append((hilbert_index(order, min(max(x, 0), cells), min(max(y, 0), cells)), fid))
+        keyed.sort()
+
+        self.hilbert_order = array("q", (fid for _, fid in keyed))
+        self.cursor = 0
+
+    def next_unlabeled(self, count=1):
+        """Return up to count unlabeled fids following the cursor in Hilbert order, wrapping around once.
+
+        The cursor moves past the first returned fid, so the others can be used for prefetching.
+        """
+        result = []
+        total = len(self.hilbert_order)
+        for step in range(total):
+            fid = self.hilbert_order[(self.cursor + step) % total]
+            if self.state(fid) == UNLABELED:
+                if not result:
+                    first_step = step
+                result.append(fid)
+                if len(result) == count:
+                    break
+        if result:
+            self.cursor = (self.cursor + first_step + 1) % total
+        return result
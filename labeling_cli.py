@@ -0,0 +1,119 @@
+"""Command line entry point for applying binary labels without the QGIS interface.
+
+Run it from the directory which contains the plugin folder, e.g.:
+
+    python -m Binary_Labeling_Plugin.labeling_cli apply buildings.gpkg damaged labels.csv
+    python -m Binary_Labeling_Plugin.labeling_cli export buildings.gpkg damaged dataset/ --val-fraction 0.1 --balance
+    cat labels.csv | python -m Binary_Labeling_Plugin.labeling_cli apply "buildings.gpkg|layername=b" damaged -
+
+Records are (fid, label) or (x, y, label) rows in CSV, or GeoJSON features with a label property.
+"""
+
+# Imports
+import argparse
+import os
+import sys
+
+
+def start_qgis():
+    # QGIS needs a QgsApplication even without a window. The offscreen platform avoids the need for a display.
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    return qgs
+
+
+def open_layer(source, provider):
+    from qgis.core import QgsVectorLayer
+
+    from .labeling_core import LabelingError
+
+    layer = QgsVectorLayer(source, os.path.basename(source), provider)
+    if not layer.isValid():
+        raise LabelingError(f"The layer: {source} could not be opened with the provider: {provider}.")
+    return layer
+
+
+def run_apply(args):
+    from .labeling_core import apply_label_records, read_label_records
+
+    layer = open_layer(args.layer, args.provider)
+
+    def progress(written):
+        if args.verbose:
+            print(f"{written} features written", file=sys.stderr)
+
+    records = read_label_records(args.records, args.format)
+    stats = apply_label_records(layer, args.field, records, chunk_size=args.chunk_size, tolerance=args.tolerance, progress=progress)
+    print(f"{stats['written']} features written in {stats['chunks']} chunks, {stats['unmatched']} records matched no feature")
+
+
+def run_export(args):
+    from .label_export import LabelExporter
+
+    layer = open_layer(args.layer, args.provider)
+
+    def progress(percent):
+        if args.verbose:
+            print(f"{percent:.1f}% read", file=sys.stderr)
+
+    exporter = LabelExporter(layer, args.field, args.directory, output_format=args.format, shard_size=args.shard_size, chunk_size=args.chunk_size,
+                             val_fraction=args.val_fraction, balance=args.balance, seed=args.seed, full=args.full)
+    stats = exporter.run(progress)
+    print(f"Run {stats['run']}: {stats['train']} train and {stats['val']} val features exported, {stats['unchanged']} unchanged, "
+          f"{stats['skipped']} left out by balancing, {stats['removed']} removed")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="labeling_cli", description="Apply or export binary labels of a vector layer without the QGIS interface.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    apply_parser = subparsers.add_parser("apply", help="apply (fid or point, label) records to a field of a layer")
+    apply_parser.add_argument("layer", help="layer source, e.g. a GeoPackage or shapefile path")
+    apply_parser.add_argument("field", help="integer field which receives the labels")
+    apply_parser.add_argument("records", help='CSV or GeoJSON records file, or "-" for CSV on stdin')
+    apply_parser.add_argument("--format", choices=["csv", "geojson"], default=None, help="records format (default: from the file extension)")
+    apply_parser.add_argument("--provider", default="ogr", help="QGIS data provider of the layer (default: ogr)")
+    apply_parser.add_argument("--chunk-size", type=int, default=10000, help="features written per provider call (default: 10000)")
+    apply_parser.add_argument("--tolerance", type=float, default=0.0, help="search tolerance for point records, in layer units (default: 0)")
+    apply_parser.add_argument("-v", "--verbose", action="store_true", help="report progress after every chunk")
+    apply_parser.set_defaults(run=run_apply)
+
+    export_parser = subparsers.add_parser("export", help="export the features labeled 0 or 1 to a sharded training dataset")
+    export_parser.add_argument("layer", help="layer source, e.g. a GeoPackage or shapefile path")
+    export_parser.add_argument("field", help="integer field which holds the labels")
+    export_parser.add_argument("directory", help="output directory. An export already in it is continued with the changed features only.")
+    export_parser.add_argument("--format", choices=["parquet", "csv"], default="parquet", help="GeoParquet (needs pyarrow) or CSV with hex WKB geometries (default: parquet)")
+    export_parser.add_argument("--provider", default="ogr", help="QGIS data provider of the layer (default: ogr)")
+    export_parser.add_argument("--shard-size", type=int, default=500000, help="features per output file (default: 500000)")
+    export_parser.add_argument("--chunk-size", type=int, default=10000, help="features held in memory and written at once (default: 10000)")
+    export_parser.add_argument("--val-fraction", type=float, default=0.0, help="fraction of each class in the val split (default: 0)")
+    export_parser.add_argument("--balance", action="store_true", help="leave features of the larger class out of the train split to balance the classes")
+    export_parser.add_argument("--seed", type=int, default=0, help="seed of the class balancing (default: 0)")
+    export_parser.add_argument("--full", action="store_true", help="export every labeled feature again, not only the changed ones")
+    export_parser.add_argument("-v", "--verbose", action="store_true", help="report progress")
+    export_parser.set_defaults(run=run_export)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    qgs = start_qgis()
+
+    from .labeling_core import LabelingError
+
+    try:
+        args.run(args)
+    except (LabelingError, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        qgs.exitQgis()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
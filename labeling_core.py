@@ -0,0 +1,177 @@
+# Imports
+import csv
+import json
+import sys
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsFeatureRequest, QgsFields, QgsPointXY, QgsVectorDataProvider
+
+from .spatial_index import LayerHitIndex
+
+# This module holds the labeling logic which does not need the QGIS interface, the comboboxes or the message bar.
+# The toolbar and the command line (labeling_cli.py) both use it.
+
+INTEGER_FIELD_TYPES = (QVariant.Int, QVariant.UInt, QVariant.LongLong, QVariant.ULongLong)
+
+
+class LabelingError(Exception):
+    """Raised when labels cannot be applied to a layer or field."""
+
+
+def is_integer_field(field):
+    return field.type() in INTEGER_FIELD_TYPES
+
+
+def resolve_field_index(layer, field_name):
+    # Return the index of an integer field of the layer, or raise a LabelingError
+    field_index = layer.fields().indexFromName(field_name)
+    if field_index < 0:
+        raise LabelingError(f"The layer: {layer.name()} has no field: {field_name}.")
+    if not is_integer_field(layer.fields().at(field_index)):
+        raise LabelingError(f"The field: {field_name} is not of type integer.")
+    return field_index
+
+
+def read_attribute_maps(layer, field_indexes, fids):
+    """Read the current values of several fields for the given feature ids with a single attribute-only request, as {fid: {field_index: value}}."""
+    request = QgsFeatureRequest().setFilterFids(list(fids))
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(list(field_indexes))
+    return {feature.id(): {field_index: feature.attribute(field_index) for field_index in field_indexes} for feature in layer.getFeatures(request)}
+
+
+def missing_feature_ids(provider, fids):
+    """Return the sorted ids out of fids which have no feature in the data provider, with a single id-only request."""
+    request = QgsFeatureRequest().setFilterFids(list(fids))
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setNoAttributes()
+    existing = {feature.id() for feature in provider.getFeatures(request)}
+    return sorted(fid for fid in fids if fid not in existing)
+
+
+def to_provider_changes(layer, changes):
+    """Translate {fid: {layer field index: value}} to provider field indexes, which differ when the layer has joined or virtual fields."""
+    fields = layer.fields()
+    provider_indexes = {}
+    provider_changes = {}
+    for fid, attributes in changes.items():
+        provider_attributes = {}
+        for field_index, value in attributes.items():
+            if field_index not in provider_indexes:
+                if fields.fieldOrigin(field_index) != QgsFields.OriginProvider:
+                    raise LabelingError(f"The field: {fields.at(field_index).name()} is not stored by the data provider of the layer: {layer.name()}.")
+                provider_indexes[field_index] = fields.fieldOriginIndex(field_index)
+            provider_attributes[provider_indexes[field_index]] = value
+        provider_changes[fid] = provider_attributes
+    return provider_changes
+
+
+def write_attribute_values(layer, changes):
+    """Write {fid: {field_index: value}} to the data provider of the layer in one bulk call. Raises a LabelingError on failure."""
+    provider = layer.dataProvider()
+    if not provider.capabilities() & QgsVectorDataProvider.ChangeAttributeValues:
+        raise LabelingError(f"The data provider of the layer: {layer.name()} does not support changing attribute values.")
+    if not provider.changeAttributeValues(to_provider_changes(layer, changes)):
+        errors = "; ".join(provider.errors()) or "unknown provider error"
+        raise LabelingError(f"Writing {len(changes)} label changes to the layer: {layer.name()} failed ({errors}).")
+
+
+def _parse_label(value):
+    label = int(value)
+    if label not in (0, 1):
+        raise LabelingError(f"The label: {value} is not 0 or 1.")
+    return label
+
+
+def _csv_records(stream):
+    # Rows are either (fid, label) or (x, y, label). A header row is allowed.
+    reader = csv.DictReader(stream)
+    columns = [name.strip().lower() for name in reader.fieldnames or []]
+    reader.fieldnames = columns
+    if "label" not in columns or not ("fid" in columns or ("x" in columns and "y" in columns)):
+        raise LabelingError("The CSV records need a label column and either a fid column or x and y columns.")
+
+    for row in reader:
+        if row.get("fid") not in (None, ""):
+            yield int(row["fid"]), _parse_label(row["label"])
+        else:
+            yield QgsPointXY(float(row["x"]), float(row["y"])), _parse_label(row["label"])
+
+
+def _geojson_records(stream):
+    # Features carry the label in their properties, and either a fid property or a point geometry.
+    collection = json.load(stream)
+    for feature in collection.get("features", []):
+        properties = feature.get("properties") or {}
+        label = _parse_label(properties["label"])
+        if properties.get("fid") is not None:
+            yield int(properties["fid"]), label
+        elif feature.get("id") is not None and not feature.get("geometry"):
+            yield int(feature["id"]), label
+        else:
+            x, y = feature["geometry"]["coordinates"][:2]
+            yield QgsPointXY(float(x), float(y)), label
+
+
+def read_label_records(path, record_format=None):
+    """Yield (fid or QgsPointXY, label) records from a CSV or GeoJSON file, or from stdin when path is "-".
+
+    The format is taken from the file extension unless record_format ("csv" or "geojson") is given. Stdin defaults to CSV.
+    """
+    if record_format is None:
+        record_format = "geojson" if path.lower().endswith((".geojson", ".json")) else "csv"
+
+    stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if record_format == "geojson":
+            yield from _geojson_records(stream)
+        else:
+            yield from _csv_records(stream)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def apply_label_records(layer, field_name, records, chunk_size=10000, tolerance=0.0, progress=None, hit_index=None):
+    """Apply (fid or QgsPointXY, label) records to a field of the layer in chunks of chunk_size features.
+
+    Each chunk is written with one changeAttributeValues() call. Points are in layer coordinates and are
+    resolved with hit_index, or with a LayerHitIndex built when the first point record arrives. The optional
+    progress callback receives the number of features written so far after every chunk.
+
+    Returns a dict with the number of written features, unmatched point records and chunks.
+    """
+    field_index = resolve_field_index(layer, field_name)
+    own_hit_index = hit_index is None
+    stats = {"written": 0, "unmatched": 0, "chunks": 0}
+    chunk = {}
+
+    def write_chunk():
+        write_attribute_values(layer, chunk)
+        stats["written"] += len(chunk)
+        stats["chunks"] += 1
+        chunk.clear()
+        if progress is not None:
+            progress(stats["written"])
+
+    for target, label in records:
+        if isinstance(target, QgsPointXY):
+            if hit_index is None:
+                hit_index = LayerHitIndex(layer)
+            fids = hit_index.hit_test(target, tolerance)
+            if not fids:
+                stats["unmatched"] += 1
+                continue
+        else:
+            fids = [target]
+
+        for fid in fids:
+            chunk[fid] = {field_index: label}
+        if len(chunk) >= chunk_size:
+            write_chunk()
+
+    if chunk:
+        write_chunk()
+    if own_hit_index and hit_index is not None:
+        hit_index.disconnect_layer()
+    return stats
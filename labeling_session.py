@@ -0,0 +1,37 @@
+# Imports
+from .label_state import LabelStateCache
+
+
+class LabelingSession:
+    """A named labeling setup: a layer, the fields one label action writes and the value each action writes to each field.
+
+    The first field is the primary one, whose labeling progress the session tracks in its own LabelStateCache.
+    The write-behind buffers and hit-test indexes are cached per layer by the plugin, so the sessions of one layer
+    share them and their writes stay in order. Switching sessions only swaps references: nothing is flushed or reloaded.
+    """
+
+    def __init__(self, name, layer=None, field_values=None):
+        self.name = name
+        self.layer = layer
+        self.field_values = dict(field_values or {})    # {field name: (value written by the 1 action, value written by the 0 action)}, primary field first
+        self.label_state = LabelStateCache()
+
+    def field_names(self):
+        return list(self.field_values)
+
+    def primary_field(self):
+        return next(iter(self.field_values), None)
+
+    def set_target(self, layer, field_name):
+        """Point the session at a layer and a single field, which the 1 and 0 actions set to 1 and 0. Any other field is dropped."""
+        self.layer = layer
+        self.field_values = {field_name: (1, 0)} if field_name else {}
+
+    def writes(self, label):
+        """Return [(field index, value)] written to the layer by the action of the given label (1 or 0)."""
+        writes = []
+        for name, values in self.field_values.items():
+            field_index = self.layer.fields().indexFromName(name)
+            if field_index >= 0:
+                writes.append((field_index, values[0] if label == 1 else values[1]))
+        return writes
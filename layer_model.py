@@ -0,0 +1,92 @@
+# Imports
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsMapLayerType, QgsProject, QgsVectorLayer
+
+from .labeling_core import is_integer_field
+
+
+class LayerFieldModel(QObject):
+    """Cached view of the vector layers of the project and their integer fields, keyed by layer id.
+
+    It follows the project's layersAdded/layersWillBeRemoved signals and each layer's nameChanged,
+    attributeAdded, attributeDeleted and updatedFields signals, and reports each change on its own,
+    so the comboboxes can be updated item by item instead of being cleared and rebuilt.
+    """
+
+    layerAdded = pyqtSignal(str)              # Emitted with the id of a vector layer added to the project
+    layerRemoved = pyqtSignal(str)            # Emitted with the id of a vector layer which is about to be removed
+    layerRenamed = pyqtSignal(str)            # Emitted with the id of a vector layer whose name changed
+    fieldsChanged = pyqtSignal(str)           # Emitted with the id of a vector layer whose fields changed
+
+    def __init__(self, project=None, parent=None):
+        super().__init__(parent)
+        self.project = project or QgsProject.instance()
+        self.layers = {}                      # {layer id: layer}, in the order the layers were added
+        self.integer_fields = {}              # {layer id: [field name]}, filled on first use
+        self.connections = {}                 # {layer id: [(signal, slot)]}, to disconnect exactly what was connected
+
+        self.project.layersAdded.connect(self.on_layers_added)
+        self.project.layersWillBeRemoved.connect(self.on_layers_will_be_removed)
+        self.on_layers_added(self.project.mapLayers().values())
+
+    def disconnect_project(self):
+        try:
+            self.project.layersAdded.disconnect(self.on_layers_added)
+            self.project.layersWillBeRemoved.disconnect(self.on_layers_will_be_removed)
+        except (TypeError, RuntimeError):
+            pass
+        for layer_id in list(self.layers):
+            self._forget(layer_id)
+
+    def layer_ids(self):
+        return list(self.layers)
+
+    def layer(self, layer_id):
+        return self.layers.get(layer_id)
+
+    def fields_of(self, layer_id):
+        """Return the names of the integer fields of the layer, the only ones which can hold a binary label."""
+        if layer_id not in self.layers:
+            return []
+        names = self.integer_fields.get(layer_id)
+        if names is None:
+            names = [field.name() for field in self.layers[layer_id].fields() if is_integer_field(field)]
+            self.integer_fields[layer_id] = names
+        return names
+
+    def on_layers_added(self, layers):
+        for layer in layers:
+            if not isinstance(layer, QgsVectorLayer) or layer.type() != QgsMapLayerType.VectorLayer or layer.id() in self.layers:
+                continue
+            layer_id = layer.id()
+            self.layers[layer_id] = layer
+            self.connections[layer_id] = [
+                (layer.nameChanged, lambda layer_id=layer_id: self.layerRenamed.emit(layer_id)),
+                (layer.attributeAdded, lambda _, layer_id=layer_id: self.on_fields_changed(layer_id)),
+                (layer.attributeDeleted, lambda _, layer_id=layer_id: self.on_fields_changed(layer_id)),
+                (layer.updatedFields, lambda layer_id=layer_id: self.on_fields_changed(layer_id)),
+            ]
+            for signal, slot in self.connections[layer_id]:
+                signal.connect(slot)
+            self.layerAdded.emit(layer_id)
+
+    def on_layers_will_be_removed(self, layer_ids):
+        for layer_id in layer_ids:
+            if layer_id in self.layers:
+                self.layerRemoved.emit(layer_id)
+                self._forget(layer_id)
+
+    def on_fields_changed(self, layer_id):
+        # Only report a change when the list of integer fields is really different
+        old_names = self.integer_fields.pop(layer_id, None)
+        if old_names != self.fields_of(layer_id):
+            self.fieldsChanged.emit(layer_id)
+
+    def _forget(self, layer_id):
+        self.layers.pop(layer_id)
+        self.integer_fields.pop(layer_id, None)
+        for signal, slot in self.connections.pop(layer_id, []):
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass  # The layer might already be deleted
@@ -0,0 +1,85 @@
+# Imports
+import time
+
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtWidgets import (QApplication, QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, QLabel,
+                                 QPushButton, QVBoxLayout)
+from qgis.gui import QgsFieldExpressionWidget
+
+from .labeling_core import LabelingError
+from .prelabeling import match_rule
+
+
+class PrelabelDialog(QDialog):
+    """Dialog which asks for a pre-labeling rule (an expression and a label) and previews how many features it matches.
+
+    The plugin runs the rule itself once the dialog is accepted, so this class only collects and previews it.
+    """
+
+    def __init__(self, layer, field_name, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Pre-label {layer.name()}")
+        self.layer = layer
+        self.field_name = field_name
+
+        self.expression_widget = QgsFieldExpressionWidget(self)
+        self.expression_widget.setLayer(layer)
+        self.expression_widget.setAllowEmptyFieldName(False)
+        self.expression_widget.fieldChanged.connect(self.on_rule_changed)
+
+        self.label_combo = QComboBox(self)
+        self.label_combo.addItem("1", 1)
+        self.label_combo.addItem("0", 0)
+
+        self.skip_labeled_check = QCheckBox("Skip features which already have a label", self)
+        self.skip_labeled_check.setChecked(True)
+        self.skip_labeled_check.toggled.connect(self.on_rule_changed)
+
+        self.preview_button = QPushButton("Preview", self)
+        self.preview_button.clicked.connect(self.preview)
+        self.preview_label = QLabel("", self)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        self.button_box.button(QDialogButtonBox.Ok).setText("Apply")
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+        form_layout = QFormLayout()
+        form_layout.addRow("Features matching:", self.expression_widget)
+        form_layout.addRow(f"Get the label in {field_name}:", self.label_combo)
+        form_layout.addRow("", self.skip_labeled_check)
+        form_layout.addRow(self.preview_button, self.preview_label)
+
+        layout = QVBoxLayout()
+        layout.addLayout(form_layout)
+        layout.addWidget(self.button_box)
+        self.setLayout(layout)
+        self.on_rule_changed()
+
+    def expression(self):
+        return self.expression_widget.expression()
+
+    def label(self):
+        return self.label_combo.currentData()
+
+    def skip_labeled(self):
+        return self.skip_labeled_check.isChecked()
+
+    def on_rule_changed(self):
+        # A preview only holds for the rule it was made for
+        self.preview_label.setText("")
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(bool(self.expression().strip()) and self.expression_widget.isValidExpression())
+
+    def preview(self):
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        start = time.perf_counter()
+        try:
+            fids, pushed_down = match_rule(self.layer, self.field_name, self.expression(), self.skip_labeled())
+        except LabelingError as e:
+            self.preview_label.setText(str(e))
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        where = "by the data provider" if pushed_down else "in parallel chunks"
+        self.preview_label.setText(f"{len(fids)} features match (evaluated {where} in {time.perf_counter() - start:.1f} s)")
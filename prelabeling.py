@@ -0,0 +1,149 @@
+# Imports
+import os
+import queue
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import (QgsAbstractFeatureIterator, QgsExpression, QgsExpressionContext, QgsExpressionContextUtils, QgsFeatureRequest, QgsSettings,
+                       QgsVectorLayerFeatureSource)
+
+from .labeling_core import LabelingError, resolve_field_index, write_attribute_values
+
+# Rule-based pre-labeling: every feature matching a QgsExpression gets the same label in one chunked bulk write.
+# Providers which compile expressions to SQL (when "Execute expressions on server-side if possible" is on, the QGIS default)
+# get the whole filter as one request, so only the matching ids come back, as long as the provider compiles all of it.
+# Otherwise (other providers, or a filter such as $area < 50 which has no SQL form) the layer is read in fid chunks, and the
+# chunks are evaluated on worker threads, each with its own feature source and prepared expression.
+
+COMPILING_PROVIDERS = ("postgres", "ogr", "spatialite", "mssql", "oracle", "hana")
+
+
+def rule_expression(layer, field_index, expression_text, skip_labeled=True):
+    """Return the filter expression of the rule, restricted to unlabeled features unless skip_labeled is False.
+
+    Raises a LabelingError when the expression does not parse.
+    """
+    expression = QgsExpression(expression_text)
+    if expression.hasParserError():
+        raise LabelingError(f"The expression is not valid: {expression.parserErrorString()}")
+    if not skip_labeled:
+        return expression
+
+    # Same rule as state_of(): anything which is not 0 or 1 counts as unlabeled. Written in plain SQL terms, so it compiles too.
+    column = QgsExpression.quotedColumnRef(layer.fields().at(field_index).name())
+    return QgsExpression(f"({expression_text}) AND ({column} IS NULL OR {column} NOT IN (0, 1))")
+
+
+def compiles_on_provider(layer):
+    return layer.providerType() in COMPILING_PROVIDERS and QgsSettings().value("qgis/compileExpressions", True, type=bool)
+
+
+def _filter_request(layer, expression):
+    # Only read what the expression needs: no geometry unless it uses one, and only the columns it references
+    request = QgsFeatureRequest()
+    if not expression.needsGeometry():
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(expression.referencedColumns(), layer.fields())
+    return request
+
+
+def _match_pushed_down(layer, expression, is_canceled):
+    # Returns None when the provider did not compile the whole filter: QGIS would then evaluate it here, on one thread
+    request = _filter_request(layer, expression)
+    request.setFilterExpression(expression.expression())
+    request.setExpressionContext(QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(layer)))
+    iterator = layer.getFeatures(request)
+    if iterator.compileStatus() != QgsAbstractFeatureIterator.Compiled:
+        iterator.close()
+        return None
+    fids = array("q")
+    for feature in iterator:
+        fids.append(feature.id())
+        if len(fids) % 10000 == 0 and is_canceled():
+            break
+    return fids
+
+
+def _match_chunk(sources, fields, expression_text, context, request, chunk):
+    # Runs on a worker thread. QgsExpression is not thread safe, so every chunk prepares its own.
+    # A feature source must not be iterated by two threads at once, so the chunk takes one from the pool while it runs.
+    expression = QgsExpression(expression_text)
+    context = QgsExpressionContext(context)
+    context.setFields(fields)
+    expression.prepare(context)
+
+    matches = array("q")
+    request = QgsFeatureRequest(request).setFilterFids(chunk)
+    source = sources.get()
+    try:
+        for feature in source.getFeatures(request):
+            context.setFeature(feature)
+            if expression.evaluate(context):
+                matches.append(feature.id())
+    finally:
+        sources.put(source)
+    return matches
+
+
+def _match_in_chunks(layer, expression, chunk_size, workers, is_canceled):
+    # One id-only pass to split the layer, then the chunks are evaluated in parallel
+    all_fids = array("q", (feature.id() for feature in layer.getFeatures(QgsFeatureRequest().setNoAttributes().setFlags(QgsFeatureRequest.NoGeometry))))
+    chunks = [list(all_fids[i:i + chunk_size]) for i in range(0, len(all_fids), chunk_size)]
+
+    # Feature sources and the expression context are created here, on the thread which owns the layer
+    context = QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+    request = _filter_request(layer, expression)
+    # A pool with one source per worker thread, so a source is only ever used by the chunk which took it
+    sources = queue.Queue()
+    for _ in range(workers):
+        sources.put(QgsVectorLayerFeatureSource(layer))
+
+    fids = array("q")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_match_chunk, sources, layer.fields(), expression.expression(), context, request, chunk)
+                   for chunk in chunks]
+        for future in futures:
+            if is_canceled():
+                for pending in futures:
+                    pending.cancel()
+                break
+            fids.extend(future.result())
+    return fids
+
+
+def match_rule(layer, field_name, expression_text, skip_labeled=True, chunk_size=50000, workers=None, is_canceled=None):
+    """Return the ids (an array('q')) of the features of the layer which match the rule, and whether the filter went to the provider.
+
+    Raises a LabelingError when the field cannot hold labels or the expression does not parse.
+    """
+    field_index = resolve_field_index(layer, field_name)
+    expression = rule_expression(layer, field_index, expression_text, skip_labeled)
+    is_canceled = is_canceled or (lambda: False)
+
+    if compiles_on_provider(layer):
+        fids = _match_pushed_down(layer, expression, is_canceled)
+        if fids is not None:
+            return fids, True
+    workers = workers or min(4, os.cpu_count() or 1)
+    return _match_in_chunks(layer, expression, chunk_size, workers, is_canceled), False
+
+
+def apply_rule(layer, field_name, expression_text, label, skip_labeled=True, chunk_size=50000, progress=None, is_canceled=None):
+    """Label every feature of the layer which matches the rule, in chunks of chunk_size features per provider call.
+
+    Returns a dict with the number of matched and written features, the number of chunks and whether the filter went to the provider.
+    """
+    field_index = resolve_field_index(layer, field_name)
+    fids, pushed_down = match_rule(layer, field_name, expression_text, skip_labeled, chunk_size, is_canceled=is_canceled)
+    stats = {"matched": len(fids), "written": 0, "chunks": 0, "pushed_down": pushed_down}
+
+    for start in range(0, len(fids), chunk_size):
+        if is_canceled is not None and is_canceled():
+            break
+        chunk = fids[start:start + chunk_size]
+        write_attribute_values(layer, {fid: {field_index: label} for fid in chunk})
+        stats["written"] += len(chunk)
+        stats["chunks"] += 1
+        if progress is not None:
+            progress(stats["written"])
+    return stats
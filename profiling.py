@@ -0,0 +1,170 @@
+# Imports
+import csv
+import json
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from qgis.PyQt.QtCore import Qt, QTimer
+from qgis.PyQt.QtWidgets import (QCheckBox, QDockWidget, QFileDialog, QHBoxLayout, QPushButton, QTableWidget,
+                                 QTableWidgetItem, QVBoxLayout, QWidget)
+
+# The plugin logs through this logger instead of print(). It only logs warnings unless debug logging is switched on,
+# and the calls pass their arguments separately, so a disabled debug call never even formats its message.
+log = logging.getLogger("BinaryLabelingPlugin")
+log.setLevel(logging.WARNING)
+if not log.handlers:
+    log.addHandler(logging.StreamHandler())
+
+_DISABLED = nullcontext()
+
+PERCENTILES = (50, 95, 99)
+
+
+def set_debug_logging(enabled):
+    log.setLevel(logging.DEBUG if enabled else logging.WARNING)
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class LatencyProfiler:
+    """Rolling timings of the phases of a label action, per phase, layer and provider type.
+
+    Every key keeps the last window samples, so the percentiles follow the current labeling session
+    rather than everything since QGIS started. When disabled, measure() returns a shared no-op context.
+    """
+
+    def __init__(self, window=1000, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.samples = {}                     # {(phase, layer name, provider type): deque of seconds}
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+
+    def reset(self):
+        self.samples = {}
+
+    def record(self, phase, layer, seconds):
+        if not self.enabled:
+            return
+        key = (phase, layer.name() if layer is not None else "", layer.providerType() if layer is not None else "")
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def measure(self, phase, layer=None):
+        if not self.enabled:
+            return _DISABLED
+        return self._measure(phase, layer)
+
+    @contextmanager
+    def _measure(self, phase, layer):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, layer, time.perf_counter() - start)
+
+    def summary(self):
+        """Return one row per key: phase, layer, provider, count, p50, p95, p99 and max in milliseconds."""
+        rows = []
+        for (phase, layer_name, provider), samples in sorted(self.samples.items()):
+            values = sorted(samples)
+            row = {"phase": phase, "layer": layer_name, "provider": provider, "count": len(values)}
+            for p in PERCENTILES:
+                row[f"p{p}_ms"] = percentile(values, p) * 1000.0
+            row["max_ms"] = values[-1] * 1000.0 if values else 0.0
+            rows.append(row)
+        return rows
+
+    def export(self, path):
+        # The format follows the file extension: .json writes a list of rows, anything else CSV
+        rows = self.summary()
+        if path.lower().endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2)
+            return
+        columns = ["phase", "layer", "provider", "count"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class ProfilerDock(QDockWidget):
+    """Dock panel which shows the rolling latency percentiles of the profiler and exports them."""
+
+    COLUMNS = ["Phase", "Layer", "Provider", "Count", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"]
+
+    def __init__(self, profiler, parent=None):
+        super().__init__("Binary Labeling Profiler", parent)
+        self.setObjectName("BinaryLabelingProfilerDock")
+        self.profiler = profiler
+
+        self.enable_check = QCheckBox("Measure label actions")
+        self.enable_check.setChecked(profiler.enabled)
+        self.enable_check.toggled.connect(profiler.set_enabled)
+
+        self.debug_check = QCheckBox("Debug logging")
+        self.debug_check.setChecked(log.isEnabledFor(logging.DEBUG))
+        self.debug_check.toggled.connect(set_debug_logging)
+
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.on_reset)
+        self.export_button = QPushButton("Export...")
+        self.export_button.clicked.connect(self.on_export)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(self.enable_check)
+        controls_layout.addWidget(self.debug_check)
+        controls_layout.addStretch()
+        controls_layout.addWidget(self.reset_button)
+        controls_layout.addWidget(self.export_button)
+
+        layout = QVBoxLayout()
+        layout.addLayout(controls_layout)
+        layout.addWidget(self.table)
+        widget = QWidget()
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        # Refresh the table once a second, only while the panel is visible
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(lambda visible: self.refresh_timer.start() if visible else self.refresh_timer.stop())
+
+    def refresh(self):
+        rows = self.profiler.summary()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row["phase"], row["layer"], row["provider"], str(row["count"])]
+            values += [f"{row[f'p{p}_ms']:.2f}" for p in PERCENTILES] + [f"{row['max_ms']:.2f}"]
+            for j, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if j >= 3:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(i, j, item)
+
+    def on_reset(self):
+        self.profiler.reset()
+        self.refresh()
+
+    def on_export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export label action timings", "", "CSV (*.csv);;JSON (*.json)")
+        if path:
+            self.profiler.export(path)
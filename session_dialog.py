@@ -0,0 +1,83 @@
+# Imports
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtWidgets import (QComboBox, QDialog, QDialogButtonBox, QFormLayout, QLineEdit, QSpinBox, QTableWidget,
+                                 QTableWidgetItem, QVBoxLayout)
+
+
+class SessionDialog(QDialog):
+    """Dialog which defines a labeling session: its name, its layer and the fields (with their values) one label action writes."""
+
+    COLUMNS = ["Field", "1 writes", "0 writes"]
+
+    def __init__(self, layer_model, taken_names, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("New labeling session")
+        self.layer_model = layer_model
+        self.taken_names = set(taken_names)
+
+        self.name_edit = QLineEdit(self)
+        self.name_edit.textChanged.connect(self.validate)
+
+        self.layer_combo = QComboBox(self)
+        for layer_id in layer_model.layer_ids():
+            self.layer_combo.addItem(layer_model.layer(layer_id).name(), layer_id)
+        self.layer_combo.currentIndexChanged.connect(self.populate_fields)
+
+        # Checked fields are written by every label action. The first checked field is the primary one.
+        self.field_table = QTableWidget(0, len(self.COLUMNS), self)
+        self.field_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.field_table.itemChanged.connect(self.validate)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        self.button_box.accepted.connect(self.accept)
+        self.button_box.rejected.connect(self.reject)
+
+        form_layout = QFormLayout()
+        form_layout.addRow("Name:", self.name_edit)
+        form_layout.addRow("Layer:", self.layer_combo)
+        form_layout.addRow("Fields:", self.field_table)
+
+        layout = QVBoxLayout()
+        layout.addLayout(form_layout)
+        layout.addWidget(self.button_box)
+        self.setLayout(layout)
+        self.populate_fields()
+
+    def _value_spin(self, value):
+        spin = QSpinBox(self.field_table)
+        spin.setRange(-2147483648, 2147483647)
+        spin.setValue(value)
+        return spin
+
+    def populate_fields(self):
+        self.field_table.blockSignals(True)
+        field_names = self.layer_model.fields_of(self.layer_combo.currentData()) if self.layer_combo.currentIndex() >= 0 else []
+        self.field_table.setRowCount(len(field_names))
+        for row, name in enumerate(field_names):
+            item = QTableWidgetItem(name)
+            item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+            item.setCheckState(Qt.Unchecked)
+            self.field_table.setItem(row, 0, item)
+            self.field_table.setCellWidget(row, 1, self._value_spin(1))
+            self.field_table.setCellWidget(row, 2, self._value_spin(0))
+        self.field_table.blockSignals(False)
+        self.validate()
+
+    def layer(self):
+        return self.layer_model.layer(self.layer_combo.currentData())
+
+    def name(self):
+        return self.name_edit.text().strip()
+
+    def field_values(self):
+        """Return {field name: (value of the 1 action, value of the 0 action)} of the checked fields, in table order."""
+        values = {}
+        for row in range(self.field_table.rowCount()):
+            item = self.field_table.item(row, 0)
+            if item.checkState() == Qt.Checked:
+                values[item.text()] = (self.field_table.cellWidget(row, 1).value(), self.field_table.cellWidget(row, 2).value())
+        return values
+
+    def validate(self):
+        valid = bool(self.name()) and self.name() not in self.taken_names and self.layer() is not None and bool(self.field_values())
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(valid)
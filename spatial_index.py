@@ -0,0 +1,111 @@
+# Imports
+from qgis.PyQt.QtCore import QObject
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsGeometry, QgsPointXY, QgsRectangle, QgsSpatialIndex
+
+
+class LayerHitIndex(QObject):
+    """In-memory spatial index used for hit-testing clicks on a single vector layer.
+
+    The index is bulk loaded once from a geometry-only feature request and keeps the feature
+    geometries, so a hit test never goes back to the data provider. It follows the layer's
+    featureAdded, featureDeleted and geometryChanged signals to stay current while editing, and
+    committedFeaturesAdded to re-key the features added in edit mode once they get their real ids.
+    """
+
+    def __init__(self, layer, parent=None):
+        super().__init__(parent)
+        self.layer = layer
+
+        # Only the geometries are needed, so skip every attribute.
+        request = QgsFeatureRequest().setNoAttributes()
+        self.index = QgsSpatialIndex(layer.getFeatures(request), None, QgsSpatialIndex.FlagStoreFeatureGeometries)
+        self.temporary_fids = set()   # Negative ids of the features added in edit mode, which are replaced on commit
+
+        layer.featureAdded.connect(self.on_feature_added)
+        layer.featureDeleted.connect(self.on_feature_deleted)
+        layer.geometryChanged.connect(self.on_geometry_changed)
+        layer.committedFeaturesAdded.connect(self.on_committed_features_added)
+
+    def disconnect_layer(self):
+        try:
+            self.layer.featureAdded.disconnect(self.on_feature_added)
+            self.layer.featureDeleted.disconnect(self.on_feature_deleted)
+            self.layer.geometryChanged.disconnect(self.on_geometry_changed)
+            self.layer.committedFeaturesAdded.disconnect(self.on_committed_features_added)
+        except (TypeError, RuntimeError):
+            pass  # The layer might already be deleted
+
+    def _insert(self, fid, geometry):
+        if geometry is None or geometry.isNull():
+            return
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometry)
+        self.index.addFeature(feature)
+
+    def _remove(self, fid):
+        geometry = self.index.geometry(fid)
+        if geometry.isNull():
+            return
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometry)
+        self.index.deleteFeature(feature)
+
+    def on_feature_added(self, fid):
+        feature = self.layer.getFeature(fid)
+        self._insert(fid, feature.geometry())
+        if fid < 0:
+            self.temporary_fids.add(fid)
+
+    def on_feature_deleted(self, fid):
+        self._remove(fid)
+        self.temporary_fids.discard(fid)
+
+    def on_committed_features_added(self, layer_id, features):
+        # The committed features come with the ids the provider gave them. The temporary ids are gone with the edit buffer.
+        for fid in self.temporary_fids:
+            self._remove(fid)
+        self.temporary_fids = set()
+        for feature in features:
+            self._insert(feature.id(), feature.geometry())
+
+    def on_geometry_changed(self, fid, geometry):
+        self._remove(fid)
+        self._insert(fid, geometry)
+
+    def geometry(self, fid):
+        return self.index.geometry(fid)
+
+    def hit_test(self, point, tolerance):
+        """Return the ids of the features closest to point (in layer coordinates) within tolerance (in layer units).
+
+        Candidates from the bounding box search are checked against their exact geometry, so a click
+        inside one polygon does not also pick up a neighbouring polygon whose bounding box overlaps.
+        All features at the smallest distance are returned, e.g. every polygon that contains the point.
+        Features added in edit mode are left out until they are committed: their temporary ids are not in the data provider.
+        """
+        rect = QgsRectangle(point.x() - tolerance, point.y() - tolerance, point.x() + tolerance, point.y() + tolerance)
+        point_geometry = QgsGeometry.fromPointXY(QgsPointXY(point))
+
+        hits = []
+        best_distance = None
+        for fid in self.index.intersects(rect):
+            if fid < 0:
+                continue
+            distance = self.index.geometry(fid).distance(point_geometry)
+            if distance < 0 or distance > tolerance:
+                continue
+            if best_distance is None or distance < best_distance:
+                best_distance = distance
+                hits = [fid]
+            elif distance == best_distance:
+                hits.append(fid)
+        return hits
+
+    def features_in_area(self, area, contained_only=False):
+        """Return the ids of the features which intersect area (in layer coordinates), or which lie fully inside it."""
+        # Prepare the area once, since it is tested against every candidate
+        engine = QgsGeometry.createGeometryEngine(area.constGet())
+        engine.prepareGeometry()
+
+        predicate = engine.contains if contained_only else engine.intersects
+        return [fid for fid in self.index.intersects(area.boundingBox()) if fid >= 0 and predicate(self.index.geometry(fid).constGet())]
@@ -0,0 +1,27 @@
+# Imports
+import importlib
+import os
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+
+def load_plugin_module(name):
+    # The plugin folder is a package (it uses relative imports), so import it by its folder name
+    return importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.{name}")
+
+
+@pytest.fixture(scope="session")
+def qgis_app():
+    """Offscreen QgsApplication shared by the tests which need providers or the task manager."""
+    pytest.importorskip("qgis.core")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication
+
+    app = QgsApplication([], False)
+    app.initQgis()
+    yield app
+    app.exitQgis()
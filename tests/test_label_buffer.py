@@ -0,0 +1,163 @@
+# Imports
+import time
+
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+from qgis.core import (QgsApplication, QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsFeature,  # noqa: E402
+                       QgsField, QgsFields, QgsGeometry, QgsPointXY, QgsVectorFileWriter, QgsVectorLayer, QgsWkbTypes)
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+label_buffer = load_plugin_module("label_buffer")
+
+
+@pytest.fixture
+def gpkg_layer(qgis_app, tmp_path):
+    """GeoPackage with 3 points (fids 1 to 3) and two empty integer fields."""
+    fields = QgsFields()
+    fields.append(QgsField("label", QVariant.Int))
+    fields.append(QgsField("checked", QVariant.Int))
+    path = str(tmp_path / "labels.gpkg")
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    writer = QgsVectorFileWriter.create(path, fields, QgsWkbTypes.Point, QgsCoordinateReferenceSystem("EPSG:3857"),
+                                        QgsCoordinateTransformContext(), options)
+    for i in range(3):
+        feature = QgsFeature(fields)
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i, i)))
+        writer.addFeature(feature)
+    del writer  # Closes the file
+
+    layer = QgsVectorLayer(path, "labels", "ogr")
+    assert layer.isValid()
+    return layer
+
+
+@pytest.fixture
+def buffer(qgis_app):
+    buffer = label_buffer.LabelEditBuffer(max_pending=1000, idle_ms=0, background=True)
+    buffer.set_repaint_after_flush(False)
+    return buffer
+
+
+def stored_values(layer, field_name):
+    # Read through a new layer, so nothing cached by the tested one is seen
+    fresh = QgsVectorLayer(layer.source(), "check", layer.providerType())
+    return {feature.id(): feature[field_name] for feature in fresh.getFeatures()}
+
+
+def wait_for_task(buffer, timeout=10.0):
+    # The task reports back through the event loop, like in QGIS
+    deadline = time.monotonic() + timeout
+    while buffer.is_writing() and time.monotonic() < deadline:
+        QgsApplication.processEvents()
+        time.sleep(0.01)
+    assert not buffer.is_writing()
+
+
+def test_background_flush_writes_to_the_layer(gpkg_layer, buffer):
+    flushed = []
+    buffer.flushed.connect(lambda layer, count: flushed.append(count))
+    buffer.set_layer(gpkg_layer)
+    label = gpkg_layer.fields().indexFromName("label")
+
+    buffer.add_many({1: {label: 1}, 2: {label: 0}})
+    assert buffer.flush()
+    assert buffer.is_writing()
+    assert buffer.pending_value(1, label) == 1
+    wait_for_task(buffer)
+
+    assert flushed == [2]
+    assert stored_values(gpkg_layer, "label")[1] == 1
+    assert stored_values(gpkg_layer, "label")[2] == 0
+
+
+def test_conflict_is_reported_and_overwritten(gpkg_layer, buffer):
+    conflicts = []
+    buffer.conflictsDetected.connect(lambda layer, fids: conflicts.append(fids))
+    buffer.set_layer(gpkg_layer)
+    label = gpkg_layer.fields().indexFromName("label")
+
+    buffer.add_many({1: {label: 1}, 2: {label: 1}}, previous_values={1: {label: None}, 2: {label: None}})
+    # Somebody else labels fid 1 before the buffer is written
+    assert gpkg_layer.dataProvider().changeAttributeValues({1: {label: 0}})
+    buffer.flush()
+    wait_for_task(buffer)
+
+    assert conflicts == [[1]]
+    assert stored_values(gpkg_layer, "label")[1] == 1
+
+
+def test_failed_write_is_merged_back_under_newer_changes(gpkg_layer, buffer):
+    errors = []
+    buffer.flushFailed.connect(errors.append)
+    buffer.set_layer(gpkg_layer)
+    label = gpkg_layer.fields().indexFromName("label")
+    checked = gpkg_layer.fields().indexFromName("checked")
+
+    buffer.add_many({1: {label: 1, checked: 1}})
+    buffer.flush()
+    buffer.task.cancel()                      # A canceled write fails like any other
+    buffer.add_many({1: {label: 0}})
+    wait_for_task(buffer)
+
+    assert len(errors) == 1
+    assert buffer.pending == {1: {label: 0, checked: 1}}
+    assert stored_values(gpkg_layer, "checked")[1] != 1
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_missing_features_are_dropped_and_the_rest_is_written(gpkg_layer, buffer, background):
+    missing, errors = [], []
+    buffer.featuresMissing.connect(lambda layer, fids: missing.append(fids))
+    buffer.flushFailed.connect(errors.append)
+    buffer.set_background(background)
+    buffer.set_layer(gpkg_layer)
+    label = gpkg_layer.fields().indexFromName("label")
+
+    # fid 99 does not exist, and -1 is the kind of temporary id a feature added in edit mode has
+    buffer.add_many({1: {label: 1}, 99: {label: 1}, -1: {label: 0}})
+    buffer.flush()
+    wait_for_task(buffer)
+
+    assert missing == [[-1, 99]]
+    assert errors == []
+    assert buffer.pending_count() == 0
+    assert stored_values(gpkg_layer, "label")[1] == 1
+
+
+def test_flush_sync_waits_for_the_task_in_flight_and_the_ones_it_starts(gpkg_layer, buffer):
+    flushed = []
+    buffer.flushed.connect(lambda layer, count: flushed.append(count))
+    buffer.set_layer(gpkg_layer)
+    buffer.set_max_pending(1)
+    label = gpkg_layer.fields().indexFromName("label")
+
+    buffer.add_many({1: {label: 1}})          # Starts a task
+    assert buffer.is_writing()
+    buffer.add_many({2: {label: 0}})          # Requests another flush once it is done
+    assert buffer.flush_requested
+
+    assert buffer.flush_sync()
+    assert not buffer.is_writing()
+    assert buffer.pending_count() == 0
+    assert sum(flushed) == 2
+    values = stored_values(gpkg_layer, "label")
+    assert (values[1], values[2]) == (1, 0)
+
+
+def test_memory_layer_is_written_on_the_main_thread(qgis_app, buffer):
+    layer = QgsVectorLayer("Point?crs=EPSG:3857&field=label:integer", "memory", "memory")
+    feature = QgsFeature(layer.fields())
+    feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(0, 0)))
+    assert layer.dataProvider().addFeatures([feature])
+    fid = next(layer.getFeatures()).id()
+    buffer.set_layer(layer)
+
+    buffer.add_many({fid: {0: 1}})
+    assert buffer.flush()
+    assert not buffer.is_writing()
+    assert buffer.pending_count() == 0
+    assert next(layer.getFeatures())["label"] == 1
@@ -0,0 +1,85 @@
+# Imports
+import json
+from array import array
+
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+label_export = load_plugin_module("label_export")
+
+TRAIN, VAL, REMOVED = label_export.TRAIN, label_export.VAL, label_export.REMOVED
+
+
+def code(label, split):
+    return label * 4 + split
+
+
+def state_with(tmp_path, entries):
+    state = label_export.ExportState(str(tmp_path))
+    state._merge(array("q", [fid for fid, _ in entries]), array("b", [c for _, c in entries]))
+    return state
+
+
+def test_merge_keeps_fids_sorted(tmp_path):
+    state = state_with(tmp_path, [(5, code(1, TRAIN)), (1, code(0, VAL)), (3, code(1, VAL))])
+    state._merge(array("q", [4, 2, 6]), array("b", [code(0, TRAIN)] * 3))
+    assert list(state.fids) == [1, 2, 3, 4, 5, 6]
+    assert list(state.codes) == [code(0, VAL), code(0, TRAIN), code(1, VAL), code(0, TRAIN), code(1, TRAIN), code(0, TRAIN)]
+    state.close()
+
+
+def test_merge_later_entry_wins(tmp_path):
+    state = state_with(tmp_path, [(1, code(0, TRAIN)), (2, code(0, TRAIN))])
+    state._merge(array("q", [2, 1, 2]), array("b", [code(1, TRAIN), code(1, VAL), code(0, VAL)]))
+    assert list(state.fids) == [1, 2]
+    assert list(state.codes) == [code(1, VAL), code(0, VAL)]
+    state.close()
+
+
+def test_merge_removed_entry_drops_the_feature(tmp_path):
+    state = state_with(tmp_path, [(1, code(1, TRAIN)), (2, code(0, VAL)), (3, code(1, VAL))])
+    state._merge(array("q", [2, 4, 4]), array("b", [code(0, REMOVED), code(1, TRAIN), code(1, REMOVED)]))
+    assert list(state.fids) == [1, 3]
+    assert list(state.codes) == [code(1, TRAIN), code(1, VAL)]
+    state.close()
+
+
+def test_interrupted_run_is_merged_on_the_next_start(tmp_path):
+    state = label_export.ExportState(str(tmp_path))
+    state.append([(3, code(1, TRAIN)), (1, code(0, VAL))])
+    state.close()
+
+    state = label_export.ExportState(str(tmp_path))
+    assert list(state.fids) == [1, 3]
+    assert state.lookup(3) == code(1, TRAIN)
+    assert state.unseen() == [(1, code(0, VAL))]
+    state.close()
+
+
+def test_resumed_run_counts_every_feature_once(qgis_app, tmp_path):
+    from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+    layer = QgsVectorLayer("Point?crs=EPSG:3857&field=label:integer", "export", "memory")
+    features = []
+    for i in range(30):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i, i)))
+        feature.setAttributes([1])
+        features.append(feature)
+    assert layer.dataProvider().addFeatures(features)
+
+    def exporter():
+        return label_export.LabelExporter(layer, "label", str(tmp_path), output_format="csv", shard_size=10, chunk_size=5, val_fraction=0.2)
+
+    # Cancel part way: some decisions are in closed shards, others only in buffers and open shards
+    calls = []
+    assert exporter().run(is_canceled=lambda: calls.append(1) or len(calls) > 23) is None
+    stats = exporter().run()
+
+    with open(tmp_path / label_export.MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["split_counts"]["1"] == [30, 6]
+    assert manifest["split_counts"]["0"] == [0, 0]
+    assert stats["unchanged"] + stats["train"] + stats["val"] == 30
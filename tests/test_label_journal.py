@@ -0,0 +1,66 @@
+# Imports
+import json
+
+from conftest import load_plugin_module
+
+label_journal = load_plugin_module("label_journal")
+
+
+def test_append_numbers_entries_and_batches(tmp_path):
+    journal = label_journal.LabelJournal(str(tmp_path / "journal.jsonl"))
+    assert journal.append("label", {1: (None, 1), 2: (0, 1)}) == 2
+    assert journal.append("label", {3: (None, 0)}) == 3
+    entries = journal.uncommitted()
+    assert [(entry["seq"], entry["batch"], entry["fid"]) for entry in entries] == [(1, 1, 1), (2, 1, 2), (3, 2, 3)]
+    assert (entries[1]["old"], entries[1]["new"]) == (0, 1)
+    journal.close()
+
+
+def test_non_plain_values_are_journaled_as_null(tmp_path):
+    journal = label_journal.LabelJournal(str(tmp_path / "journal.jsonl"))
+    journal.append("label", {1: (object(), True)})
+    entry = journal.uncommitted()[0]
+    assert (entry["old"], entry["new"]) == (None, None)
+    journal.close()
+
+
+def test_commit_marker_and_compact(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = label_journal.LabelJournal(path)
+    journal.append("label", {1: (None, 1), 2: (None, 1)})
+    journal.mark_committed()
+    journal.append("label", {3: (None, 0)})
+    assert [entry["fid"] for entry in journal.uncommitted()] == [3]
+
+    journal.compact()
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["fid"] for line in f] == [3]
+    journal.close()
+
+
+def test_reopen_resumes_sequence_and_replays_uncommitted(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = label_journal.LabelJournal(path)
+    journal.append("label", {1: (None, 1)})
+    journal.mark_committed()
+    journal.append("label", {2: (None, 0)})
+    journal.close()
+
+    journal = label_journal.LabelJournal(path)
+    assert (journal.last_seq, journal.last_batch, journal.committed_seq) == (2, 2, 1)
+    assert [entry["fid"] for entry in journal.uncommitted()] == [2]
+    assert journal.append("label", {3: (None, 1)}) == 3
+    journal.close()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = label_journal.LabelJournal(path)
+    journal.append("label", {1: (None, 1)})
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "batch": 2, "fid"')
+
+    journal = label_journal.LabelJournal(path)
+    assert [entry["fid"] for entry in journal.uncommitted()] == [1]
+    journal.close()
@@ -0,0 +1,25 @@
+# Imports
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+label_state = load_plugin_module("label_state")
+
+
+def test_hilbert_index_of_the_first_order_curve():
+    assert [label_state.hilbert_index(1, x, y) for x, y in [(0, 0), (0, 1), (1, 1), (1, 0)]] == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("order", [2, 3, 5])
+def test_hilbert_index_visits_every_cell_once_through_neighbours(order):
+    n = 1 << order
+    cells = {label_state.hilbert_index(order, x, y): (x, y) for x in range(n) for y in range(n)}
+    assert sorted(cells) == list(range(n * n))
+    for d in range(n * n - 1):
+        (x1, y1), (x2, y2) = cells[d], cells[d + 1]
+        assert abs(x1 - x2) + abs(y1 - y2) == 1
+
+
+def test_state_of():
+    assert [label_state.state_of(value) for value in (0, 1, 2, None, True, "1")] == [0, 1] + [label_state.UNLABELED] * 4
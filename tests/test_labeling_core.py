@@ -0,0 +1,88 @@
+# Imports
+import json
+
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle, QgsVectorLayer  # noqa: E402
+
+labeling_core = load_plugin_module("labeling_core")
+LabelingError = labeling_core.LabelingError
+
+
+@pytest.fixture
+def layer(qgis_app):
+    """Unit squares at x = 0, 2 and 4 with an integer label field and a text field."""
+    layer = QgsVectorLayer("Polygon?crs=EPSG:3857&field=label:integer&field=name:string", "squares", "memory")
+    features = []
+    for x in (0, 2, 4):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, 0, x + 1, 1)))
+        features.append(feature)
+    assert layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def as_tuples(records):
+    return [((target.x(), target.y()) if isinstance(target, QgsPointXY) else target, label) for target, label in records]
+
+
+def test_csv_records_by_fid_and_by_point(tmp_path):
+    path = write(tmp_path, "labels.csv", "FID,X,Y,Label\n3,,,1\n,1.5,2.5,0\n")
+    assert as_tuples(labeling_core.read_label_records(path)) == [(3, 1), ((1.5, 2.5), 0)]
+
+
+def test_csv_records_need_a_label_and_a_target(tmp_path):
+    path = write(tmp_path, "labels.csv", "fid,value\n1,1\n")
+    with pytest.raises(LabelingError):
+        list(labeling_core.read_label_records(path))
+
+
+def test_labels_other_than_0_and_1_are_refused(tmp_path):
+    path = write(tmp_path, "labels.csv", "fid,label\n1,2\n")
+    with pytest.raises(LabelingError):
+        list(labeling_core.read_label_records(path))
+
+
+def test_geojson_records(tmp_path):
+    collection = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"fid": 4, "label": 1}, "geometry": None},
+        {"type": "Feature", "id": 5, "properties": {"label": 0}, "geometry": None},
+        {"type": "Feature", "properties": {"label": 1}, "geometry": {"type": "Point", "coordinates": [0.5, 0.5]}},
+    ]}
+    path = write(tmp_path, "labels.geojson", json.dumps(collection))
+    assert as_tuples(labeling_core.read_label_records(path)) == [(4, 1), (5, 0), ((0.5, 0.5), 1)]
+
+
+def test_the_format_can_be_forced(tmp_path):
+    path = write(tmp_path, "labels.txt", json.dumps({"features": [{"properties": {"fid": 1, "label": 0}}]}))
+    assert as_tuples(labeling_core.read_label_records(path, "geojson")) == [(1, 0)]
+
+
+def test_resolve_field_index(layer):
+    assert labeling_core.resolve_field_index(layer, "label") == 0
+    with pytest.raises(LabelingError):
+        labeling_core.resolve_field_index(layer, "name")
+    with pytest.raises(LabelingError):
+        labeling_core.resolve_field_index(layer, "missing")
+
+
+def test_apply_label_records_in_chunks(layer):
+    fids = {round(feature.geometry().boundingBox().xMinimum()): feature.id() for feature in layer.getFeatures()}
+    written = []
+    records = [(fids[0], 1), (QgsPointXY(2.5, 0.5), 0), (QgsPointXY(10, 10), 1), (fids[4], 1)]
+
+    stats = labeling_core.apply_label_records(layer, "label", records, chunk_size=2, tolerance=0.1, progress=written.append)
+
+    assert stats == {"written": 3, "unmatched": 1, "chunks": 2}
+    assert written == [2, 3]
+    values = {feature.id(): feature["label"] for feature in layer.getFeatures()}
+    assert (values[fids[0]], values[fids[2]], values[fids[4]]) == (1, 0, 1)
@@ -0,0 +1,44 @@
+# Imports
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+from qgis.core import QgsVectorLayer  # noqa: E402
+
+labeling_session = load_plugin_module("labeling_session")
+
+
+@pytest.fixture
+def layer(qgis_app):
+    return QgsVectorLayer("Point?crs=EPSG:3857&field=a:integer&field=b:integer&field=c:integer", "session", "memory")
+
+
+def test_set_target_replaces_the_fields(layer):
+    session = labeling_session.LabelingSession("Default")
+    for field_name in ("a", "b", "c"):
+        session.set_target(layer, field_name)
+    assert session.field_values == {"c": (1, 0)}
+    assert session.writes(1) == [(2, 1)]
+    assert session.writes(0) == [(2, 0)]
+
+
+def test_set_target_without_a_field(layer):
+    session = labeling_session.LabelingSession("Default")
+    session.set_target(layer, "a")
+    session.set_target(None, None)
+    assert session.layer is None
+    assert session.field_values == {}
+    assert session.primary_field() is None
+
+
+def test_named_session_writes_every_field_primary_first(layer):
+    session = labeling_session.LabelingSession("Roofs", layer, {"b": (1, 0), "a": (7, 3)})
+    assert session.primary_field() == "b"
+    assert session.writes(1) == [(1, 1), (0, 7)]
+    assert session.writes(0) == [(1, 0), (0, 3)]
+
+
+def test_writes_skip_fields_the_layer_no_longer_has(layer):
+    session = labeling_session.LabelingSession("Gone", layer, {"a": (1, 0), "missing": (1, 0)})
+    assert session.writes(1) == [(0, 1)]
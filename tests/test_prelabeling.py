@@ -0,0 +1,93 @@
+# Imports
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+from qgis.core import (QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsFeature, QgsField,  # noqa: E402
+                       QgsFields, QgsGeometry, QgsRectangle, QgsVectorFileWriter, QgsVectorLayer, QgsWkbTypes)
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+prelabeling = load_plugin_module("prelabeling")
+LabelingError = load_plugin_module("labeling_core").LabelingError
+
+SIZES = [1, 3, 6, 8, 10, 12]    # Square i has the side SIZES[i], so an area of SIZES[i] ** 2
+LABELS = [None, None, 0, None, 1, 7]
+
+
+def add_squares(add, fields):
+    for i, (size, label) in enumerate(zip(SIZES, LABELS)):
+        feature = QgsFeature(fields)
+        feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(i * 20, 0, i * 20 + size, size)))
+        feature.setAttributes([size, label])
+        add(feature)
+
+
+@pytest.fixture
+def memory_layer(qgis_app):
+    layer = QgsVectorLayer("Polygon?crs=EPSG:3857&field=size:integer&field=label:integer", "squares", "memory")
+    features = []
+    add_squares(features.append, layer.fields())
+    assert layer.dataProvider().addFeatures(features)
+    return layer
+
+
+@pytest.fixture
+def gpkg_layer(qgis_app, tmp_path):
+    fields = QgsFields()
+    fields.append(QgsField("size", QVariant.Int))
+    fields.append(QgsField("label", QVariant.Int))
+    path = str(tmp_path / "squares.gpkg")
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    writer = QgsVectorFileWriter.create(path, fields, QgsWkbTypes.Polygon, QgsCoordinateReferenceSystem("EPSG:3857"),
+                                        QgsCoordinateTransformContext(), options)
+    add_squares(writer.addFeature, fields)
+    del writer  # Closes the file
+    layer = QgsVectorLayer(path, "squares", "ogr")
+    assert layer.isValid()
+    return layer
+
+
+def sizes_of(layer, fids):
+    return sorted(layer.getFeature(fid)["size"] for fid in fids)
+
+
+def test_rule_expression_refuses_parser_errors(memory_layer):
+    with pytest.raises(LabelingError):
+        prelabeling.rule_expression(memory_layer, 1, "size >")
+
+
+def test_rule_expression_restricts_to_unlabeled_features(memory_layer):
+    assert prelabeling.rule_expression(memory_layer, 1, "size > 5", skip_labeled=False).expression() == "size > 5"
+    expression = prelabeling.rule_expression(memory_layer, 1, "size > 5")
+    assert expression.expression() == '(size > 5) AND ("label" IS NULL OR "label" NOT IN (0, 1))'
+    assert not expression.hasParserError()
+
+
+@pytest.mark.parametrize("skip_labeled, expected", [(True, [8, 12]), (False, [6, 8, 10, 12])])
+def test_match_rule_in_parallel_chunks(memory_layer, skip_labeled, expected):
+    fids, pushed_down = prelabeling.match_rule(memory_layer, "label", "size > 5", skip_labeled, chunk_size=2, workers=3)
+    assert not pushed_down
+    assert sizes_of(memory_layer, fids) == expected
+
+
+def test_compiled_rule_is_pushed_down(gpkg_layer):
+    fids, pushed_down = prelabeling.match_rule(gpkg_layer, "label", "size > 5")
+    assert pushed_down
+    assert sizes_of(gpkg_layer, fids) == [8, 12]
+
+
+def test_rule_which_does_not_compile_runs_in_chunks(gpkg_layer):
+    fids, pushed_down = prelabeling.match_rule(gpkg_layer, "label", "$area < 50", chunk_size=2, workers=2)
+    assert not pushed_down
+    assert sizes_of(gpkg_layer, fids) == [1, 3]
+
+
+def test_apply_rule_writes_in_chunks(memory_layer):
+    written = []
+    stats = prelabeling.apply_rule(memory_layer, "label", "size > 5", 1, chunk_size=1, progress=written.append)
+    assert stats == {"matched": 2, "written": 2, "chunks": 2, "pushed_down": False}
+    assert written == [1, 2]
+    labels = {feature["size"]: feature["label"] for feature in memory_layer.getFeatures()}
+    assert (labels[6], labels[8], labels[10], labels[12]) == (0, 1, 1, 1)
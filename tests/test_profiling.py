@@ -0,0 +1,20 @@
+# Imports
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.PyQt.QtWidgets")
+profiling = load_plugin_module("profiling")
+
+
+def test_percentile_of_an_empty_list():
+    assert profiling.percentile([], 50) == 0.0
+
+
+@pytest.mark.parametrize("p, expected", [(0, 1), (10, 1), (50, 5), (51, 6), (95, 10), (99, 10), (100, 10)])
+def test_percentile_is_nearest_rank(p, expected):
+    assert profiling.percentile(list(range(1, 11)), p) == expected
+
+
+def test_percentile_of_one_value():
+    assert profiling.percentile([7.5], 99) == 7.5
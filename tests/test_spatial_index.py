@@ -0,0 +1,69 @@
+# Imports
+import pytest
+
+from conftest import load_plugin_module
+
+pytest.importorskip("qgis.core")
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle, QgsVectorLayer  # noqa: E402
+
+spatial_index = load_plugin_module("spatial_index")
+
+
+def square(layer, x, y):
+    feature = QgsFeature(layer.fields())
+    feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + 1.0, y + 1.0)))
+    return feature
+
+
+@pytest.fixture
+def layer(qgis_app):
+    """Unit squares at x = 0, 2 and 4."""
+    layer = QgsVectorLayer("Polygon?crs=EPSG:3857", "squares", "memory")
+    assert layer.dataProvider().addFeatures([square(layer, 0, 0), square(layer, 2, 0), square(layer, 4, 0)])
+    return layer
+
+
+def fids_by_x(layer):
+    return {round(feature.geometry().boundingBox().xMinimum()): feature.id() for feature in layer.getFeatures()}
+
+
+def test_hit_test_picks_the_feature_under_the_point(layer):
+    index = spatial_index.LayerHitIndex(layer)
+    fids = fids_by_x(layer)
+    assert index.hit_test(QgsPointXY(0.5, 0.5), 0.1) == [fids[0]]
+    assert index.hit_test(QgsPointXY(4.5, 0.5), 0.0) == [fids[4]]
+    index.disconnect_layer()
+
+
+def test_hit_test_uses_exact_geometries_and_tolerance(layer):
+    index = spatial_index.LayerHitIndex(layer)
+    fids = fids_by_x(layer)
+    # Halfway between two squares: both are at the smallest distance, but only within the tolerance
+    assert index.hit_test(QgsPointXY(1.5, 0.5), 0.1) == []
+    assert sorted(index.hit_test(QgsPointXY(1.5, 0.5), 0.6)) == sorted([fids[0], fids[2]])
+    # Closer to one square than to the other
+    assert index.hit_test(QgsPointXY(1.2, 0.5), 0.9) == [fids[0]]
+    index.disconnect_layer()
+
+
+def test_features_in_area(layer):
+    index = spatial_index.LayerHitIndex(layer)
+    fids = fids_by_x(layer)
+    area = QgsGeometry.fromRect(QgsRectangle(-0.5, -0.5, 2.5, 1.5))
+    assert sorted(index.features_in_area(area)) == sorted([fids[0], fids[2]])
+    assert index.features_in_area(area, contained_only=True) == [fids[0]]
+    index.disconnect_layer()
+
+
+def test_features_added_in_edit_mode_are_re_keyed_on_commit(layer):
+    index = spatial_index.LayerHitIndex(layer)
+    assert layer.startEditing()
+    assert layer.addFeature(square(layer, 6, 0))
+    assert index.hit_test(QgsPointXY(6.5, 0.5), 0.1) == []       # Its temporary id is not in the provider yet
+    assert index.temporary_fids
+
+    assert layer.commitChanges()
+    fids = index.hit_test(QgsPointXY(6.5, 0.5), 0.1)
+    assert fids == [fids_by_x(layer)[6]] and fids[0] >= 0
+    assert not index.temporary_fids
+    index.disconnect_layer()